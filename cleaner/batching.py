@@ -0,0 +1,134 @@
+import re
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+# Route53 allows 1000 changes and 1000 ResourceRecord values per request
+ROUTE53_MAX_CHANGES = 1000
+ROUTE53_MAX_VALUES = 1000
+# TerminateInstances has no documented ID limit; stay at the EC2 filter size
+EC2_TERMINATE_BATCH = 1000
+
+# Splitting a throttled batch would only multiply the request rate
+THROTTLE_CODES = {'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                  'PriorRequestNotComplete', 'TooManyRequestsException', 'SlowDown'}
+
+# Errors caused by particular items of a batch; anything else (AccessDenied,
+# NoSuchHostedZone, expired credentials, throttling) fails the whole batch
+ROUTE53_ITEM_CODES = {'InvalidChangeBatch'}
+EC2_TERMINATE_ITEM_CODES = {'InvalidInstanceID.NotFound', 'InvalidInstanceID.Malformed',
+                            'OperationNotPermitted'}
+
+# "Tried to delete resource record set [name='a.example.com.', type='A'] but it was not found"
+_ROUTE53_RECORD = re.compile(r"name='([^']*)', type='([^']*)'")
+_INSTANCE_ID = re.compile(r'i-[0-9a-f]+')
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def run_batch(items, call, item_codes, named=None):
+    """
+    Call `call(items)` and attribute failures to individual items.
+
+    Route53 change batches and TerminateInstances are all-or-nothing: one
+    missing record or instance fails the whole request. Only errors with a
+    code in item_codes are blamed on particular items. If `named(message,
+    items)` picks the failing items out of the error message, they fail and
+    the rest is retried as one batch; otherwise the batch is split in half
+    until the failing items are isolated, which costs O(failures * log n)
+    extra calls instead of one call per item. Any other error fails the
+    whole batch at once.
+
+    Returns a list of (item, error) pairs; error is None for items that
+    succeeded.
+    """
+    try:
+        call(items)
+        return [(item, None) for item in items]
+    except ClientError as e:
+        error = e
+    if len(items) == 1 or error.response['Error']['Code'] not in item_codes:
+        return [(item, error) for item in items]
+    if named is not None:
+        failed = named(error.response['Error'].get('Message', ''), items)
+        if failed:
+            failed = {id(item) for item in failed}
+            rest = [item for item in items if id(item) not in failed]
+            return ([(item, error) for item in items if id(item) in failed]
+                    + (run_batch(rest, call, item_codes, named) if rest else []))
+    middle = len(items) // 2
+    return (run_batch(items[:middle], call, item_codes, named)
+            + run_batch(items[middle:], call, item_codes, named))
+
+
+def _record_key(name, record_type):
+    return name.rstrip('.').lower(), record_type
+
+
+def named_records(message, records):
+    names = {_record_key(name, record_type) for name, record_type in _ROUTE53_RECORD.findall(message)}
+    return [r for r in records if _record_key(r.name, r.type) in names]
+
+
+def named_instances(message, instances):
+    ids = set(_INSTANCE_ID.findall(message))
+    return [i for i in instances if i.instance_id in ids]
+
+
+def route53_change(record):
+    rr_set = {'Name': record.name, 'Type': record.type}
+    if record.alias_target:
+        # A DELETE must match the record exactly; aliases have no TTL
+        zone_id, dns_name, evaluate = record.alias_target
+        rr_set['AliasTarget'] = {'HostedZoneId': zone_id, 'DNSName': dns_name,
+                                 'EvaluateTargetHealth': evaluate}
+    else:
+        rr_set['TTL'] = record.ttl
+        rr_set['ResourceRecords'] = [{'Value': v} for v in record.values]
+    return {'Action': 'DELETE', 'ResourceRecordSet': rr_set}
+
+
+def route53_batches(records):
+    """
+    Group Route53 records by hosted zone into the largest change batches the
+    API accepts. Yields (hosted_zone_id, [records]).
+    """
+    by_zone = OrderedDict()
+    for record in records:
+        by_zone.setdefault(record.hosted_zone_id, []).append(record)
+
+    for zone_id, zone_records in by_zone.items():
+        batch, values = [], 0
+        for record in zone_records:
+            count = max(1, len(record.values))
+            if batch and (len(batch) == ROUTE53_MAX_CHANGES or values + count > ROUTE53_MAX_VALUES):
+                yield zone_id, batch
+                batch, values = [], 0
+            batch.append(record)
+            values += count
+        if batch:
+            yield zone_id, batch
+
+
+def delete_route53_records(route53, records):
+    results = []
+    for zone_id, batch in route53_batches(records):
+        def call(items, zone_id=zone_id):
+            route53.change_resource_record_sets(
+                HostedZoneId=zone_id,
+                ChangeBatch={'Changes': [route53_change(r) for r in items]}
+            )
+        results.extend(run_batch(batch, call, ROUTE53_ITEM_CODES, named_records))
+    return results
+
+
+def terminate_instances(ec2, instances):
+    results = []
+    for batch in chunks(instances, EC2_TERMINATE_BATCH):
+        def call(items):
+            ec2.terminate_instances(InstanceIds=[i.instance_id for i in items])
+        results.extend(run_batch(batch, call, EC2_TERMINATE_ITEM_CODES, named_instances))
+    return results
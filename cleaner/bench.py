@@ -0,0 +1,441 @@
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aws-resources.json')
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+
+def write_scaled_trail(path, copies, compress=False):
+    # Repeat the fixture's records to build a trail of realistic shape
+    with open(FIXTURE) as f:
+        records = json.load(f)['Records']
+
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', encoding='utf-8') as out:
+        out.write('{"Records":[')
+        first = True
+        for _ in range(copies):
+            for record in records:
+                if not first:
+                    out.write(',')
+                out.write(json.dumps(record))
+                first = False
+        out.write(']}')
+    return copies * len(records)
+
+
+def run_ingest(mode, path):
+    import main
+
+    start = time.perf_counter()
+    if mode == 'json.load':
+        # The original implementation: decode the whole file, then filter
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            records = json.load(f)['Records']
+        # Feed the already-decoded list through the same extractors
+        original = main.iter_records
+        main.iter_records = lambda _paths: iter(records)
+        try:
+            resources = main.get_resources_to_delete(path)
+        finally:
+            main.iter_records = original
+    else:
+        resources = main.get_resources_to_delete(path)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'mode': mode,
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'resources': sum(len(v) for v in resources.values()),
+    }))
+
+
+def bench_ingest(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        suffix = '.json.gz' if args.gzip else '.json'
+        path = os.path.join(tmp, 'trail' + suffix)
+        count = write_scaled_trail(path, args.copies, args.gzip)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"Trail: {count} records, {size_mb:.1f} MB on disk")
+
+        for mode in ('json.load', 'stream'):
+            # Each mode runs in a fresh interpreter so peak RSS is not shared
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '_ingest', mode, path],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f" - {result['mode']:10} {result['seconds']:8.3f}s  "
+                  f"peak RSS {result['peak_rss_mb']:8.1f} MB  "
+                  f"{result['resources']} resources")
+
+
+def bench_parallel(args):
+    import main
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Many small files, like a CloudTrail delivery prefix
+        for i in range(args.files):
+            day = os.path.join(tmp, f'{i % 28 + 1:02d}')
+            os.makedirs(day, exist_ok=True)
+            write_scaled_trail(os.path.join(day, f'trail-{i}.json.gz'), args.copies, compress=True)
+
+        counts = [1]
+        while counts[-1] * 2 <= args.max_workers:
+            counts.append(counts[-1] * 2)
+        if counts[-1] != args.max_workers:
+            counts.append(args.max_workers)
+
+        baseline = None
+        for workers in counts:
+            start = time.perf_counter()
+            main.get_resources_to_delete(tmp, workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f" - {workers:3d} workers {elapsed:8.3f}s  speedup {baseline / elapsed:5.2f}x")
+
+
+def bench_index(args):
+    import main
+    from index import ParseIndex
+
+    with tempfile.TemporaryDirectory() as tmp:
+        logs = os.path.join(tmp, 'logs')
+        os.makedirs(logs)
+        for i in range(args.files):
+            write_scaled_trail(os.path.join(logs, f'trail-{i:05d}.json.gz'), args.copies, compress=True)
+        index = ParseIndex(os.path.join(tmp, 'index.sqlite'))
+
+        def timed(label):
+            start = time.perf_counter()
+            main.get_resources_to_delete(logs, args.workers, index)
+            elapsed = time.perf_counter() - start
+            print(f" - {label:24} {elapsed:8.3f}s")
+            return elapsed
+
+        cold = timed('cold run')
+        warm = timed('warm re-run')
+        # A nightly run: the archive grew by a few new files
+        for i in range(args.files, args.files + max(1, args.files // 100)):
+            write_scaled_trail(os.path.join(logs, f'trail-{i:05d}.json.gz'), args.copies, compress=True)
+        timed('warm re-run, +1% files')
+        print(f"Warm re-run costs {warm / cold:.1%} of the cold run")
+
+
+def _dict_resource(kind, i):
+    # The layout resources had before records.py: one dict per resource.
+    # f-strings build a fresh string per resource, as json decoding does.
+    if kind == 'Route53':
+        return {'HostedZoneId': f'Z{i % 10:012d}', 'Name': f'host-{i}.example.com.',
+                'Type': f"{'A'}", 'TTL': 300, 'Values': [f'10.0.{i // 256 % 256}.{i % 256}']}
+    if kind == 'EC2.Instances.Created':
+        return {'InstanceId': f'i-{i:017x}', 'Name': f"{'Unnamed Instance'}",
+                'PlacementGroupName': f'pg-{i % 4}', 'SecurityGroupIds': [f'sg-{i % 8:017x}']}
+    return {'VolumeId': f'vol-{i:017x}', 'Name': f"{'Unnamed Volume'}"}
+
+
+def _record_resource(kind, i):
+    from records import Instance, Route53Record, Volume
+
+    if kind == 'Route53':
+        return Route53Record(hosted_zone_id=f'Z{i % 10:012d}', name=f'host-{i}.example.com.',
+                             type=f"{'A'}", ttl=300, values=(f'10.0.{i // 256 % 256}.{i % 256}',))
+    if kind == 'EC2.Instances.Created':
+        return Instance(instance_id=f'i-{i:017x}', name=f"{'Unnamed Instance'}",
+                        placement_group_name=f'pg-{i % 4}', security_group_ids=[f'sg-{i % 8:017x}'])
+    return Volume(volume_id=f'vol-{i:017x}', name=f"{'Unnamed Volume'}")
+
+
+def bench_memory(args):
+    import tracemalloc
+
+    for kind in ('Route53', 'EC2.Instances.Created', 'EC2.Volumes.Created'):
+        sizes = {}
+        for layout, build in (('dict', _dict_resource), ('records', _record_resource)):
+            tracemalloc.start()
+            resources = [build(kind, i) for i in range(args.count)]
+            sizes[layout] = tracemalloc.get_traced_memory()[0] / len(resources)
+            tracemalloc.stop()
+            del resources
+        print(f" - {kind:22} dict {sizes['dict']:7.1f} B  records {sizes['records']:7.1f} B  "
+              f"per resource ({1 - sizes['records'] / sizes['dict']:.0%} less)")
+
+
+def run_parse(path, workers):
+    import main
+
+    files = len(os.listdir(path))
+    start = time.perf_counter()
+    resources = main.get_resources_to_delete(path, workers)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'seconds': round(elapsed, 3),
+        'files': files,
+        'resources': sum(len(v) for v in resources.values()),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }))
+
+
+def check_precheck_keeps_buckets(resources, clients):
+    """Regression check: the precheck must keep every bucket ListBuckets still reports."""
+    import main
+    from extractors import new_resources
+
+    buckets = new_resources()
+    buckets['S3.Buckets.Created'] = resources['S3.Buckets.Created']
+    kept, _ = main.prune_resources(buckets, clients)
+    if len(kept['S3.Buckets.Created']) != len(buckets['S3.Buckets.Created']):
+        raise RuntimeError(f"precheck kept {len(kept['S3.Buckets.Created'])} of "
+                           f"{len(buckets['S3.Buckets.Created'])} live buckets")
+
+
+def bench_delete(args, path):
+    import engine
+    import main
+    from clients import ClientPool
+    from extractors import by_location
+    from standin import StandIn
+
+    # Start from fresh limiter state, optionally scaled for quicker runs
+    engine._buckets.clear()
+    for service, (rate, burst, workers) in list(engine.SERVICE_LIMITS.items()):
+        engine.SERVICE_LIMITS[service] = (rate * args.rate_scale, burst * args.rate_scale, workers)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        resources = main.get_resources_to_delete(path)
+    standin = StandIn(latency=args.latency, throttle_rate=args.throttle_rate,
+                      objects_per_bucket=args.bucket_objects,
+                      bucket_names=[b.bucket_name for b in resources['S3.Buckets.Created']])
+    clients = ClientPool(factory=lambda session, service, region, config:
+                         standin.client(service, region, config))
+    check_precheck_keeps_buckets(resources, clients)
+    standin.calls.clear()
+
+    original = main._confirm
+    main._confirm = lambda title, lines, prompt: True
+    out = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            main.delete_resources(resources, clients)
+    finally:
+        main._confirm = original
+    elapsed = time.perf_counter() - start
+
+    lines = out.getvalue().splitlines()
+    deleted = sum(line.startswith('Deleted ') for line in lines)
+    return {
+        'resources': sum(len(v) for v in resources.values()),
+        'locations': len(by_location(resources)),
+        'deleted': deleted,
+        'failed': sum(line.startswith('Error deleting ') for line in lines),
+        'seconds': round(elapsed, 3),
+        'deletions_per_sec': round(deleted / elapsed, 1),
+        'api_calls': sum(standin.calls.values()),
+        'injected_throttles': sum(standin.throttled.values()),
+        'objects_deleted': standin.objects_deleted,
+        'objects_per_sec': round(standin.objects_deleted / elapsed),
+        'bytes_freed': standin.bytes_deleted,
+        'services': engine.throttle_summary(),
+    }
+
+
+def _arn(resource_type, r):
+    # The ARN the Resource Groups Tagging API reports for a resource
+    ec2 = f"arn:aws:ec2:{r.region}:{r.account}"
+    return {
+        'EC2.Instances.Created': lambda: f"{ec2}:instance/{r.instance_id}",
+        'EC2.Volumes.Created': lambda: f"{ec2}:volume/{r.volume_id}",
+        'EC2.SecurityGroup': lambda: f"{ec2}:security-group/{r.group_id}",
+        'EC2.NetworkInterface': lambda: f"{ec2}:network-interface/{r.network_interface_id}",
+        'EC2.PlacementGroup': lambda: f"{ec2}:placement-group/{r.placement_group_name}",
+        'S3.Buckets.Created': lambda: f"arn:aws:s3:::{r.bucket_name}",
+        'LOGS.LogGroup': lambda: f"arn:aws:logs:{r.region}:{r.account}:log-group:{r.log_group_name}",
+        'Lambda.Function': lambda: f"arn:aws:lambda:{r.region}:{r.account}:function:{r.function_name}",
+    }.get(resource_type, lambda: None)()
+
+
+def bench_discover(args):
+    import main
+    from clients import ClientPool
+    from standin import StandIn
+    from synthetic import write_trail_files
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_trail_files(tmp, args.records, regions=args.regions)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            from_trail = main.get_resources_to_delete(tmp)
+        parse_seconds = time.perf_counter() - start
+
+    # Tag every discoverable resource the trail created, plus as many
+    # resources of other teams that the tag filter has to leave out
+    tagged = []
+    for resource_type, found in from_trail.items():
+        for r in found:
+            arn = _arn(resource_type, r)
+            if arn:
+                tags = {'Name': getattr(r, 'name', None) or 'unnamed'}
+                tagged.append((r.region, arn, dict(tags, Team='cleaner')))
+                tagged.append((r.region, arn + '-other', dict(tags, Team='other')))
+    standin = StandIn(latency=args.latency, tagged=tagged)
+    clients = ClientPool(factory=lambda session, service, region, config:
+                         standin.client(service, region, config))
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        discovered = main.discover_from_tags(clients, ['Team=cleaner'], args.regions)
+    discover_seconds = time.perf_counter() - start
+
+    print(f"Trail scan:    {parse_seconds:8.3f}s for {args.records} records")
+    print(f"Tag discovery: {discover_seconds:8.3f}s, {sum(standin.calls.values())} API calls "
+          f"across {len(args.regions)} regions")
+    for resource_type, found in discovered.items():
+        expected = sum(1 for r in from_trail[resource_type] if _arn(resource_type, r))
+        if found or expected:
+            print(f" - {resource_type:<24} trail {expected:>6}  tags {len(found):>6}")
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(args):
+    from synthetic import write_trail_files
+
+    mix = {'match_ratio': args.match_ratio, 'delete_ratio': args.delete_ratio, 'seed': args.seed,
+           'regions': args.regions}
+    report = {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': {name: value for name, value in vars(args).items() if name != 'func'},
+        'parse': [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.records:
+            path = os.path.join(tmp, f'parse-{count}')
+            write_trail_files(path, count, args.records_per_file, **mix)
+            # A fresh interpreter per size so peak RSS belongs to that run
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '_parse', path, str(args.workers)],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            result['records'] = count
+            result['records_per_sec'] = round(count / result['seconds'])
+            report['parse'].append(result)
+            print(f" - parse {count:>9} records {result['seconds']:8.3f}s  "
+                  f"{result['records_per_sec']:>8} records/sec  "
+                  f"peak RSS {result['peak_rss_mb']:8.1f} MB", file=sys.stderr)
+
+        if args.delete_records:
+            path = os.path.join(tmp, 'delete')
+            write_trail_files(path, args.delete_records, args.records_per_file, **mix)
+            report['delete'] = bench_delete(args, path)
+            print(f" - delete {report['delete']['resources']} resources "
+                  f"{report['delete']['seconds']:8.3f}s  "
+                  f"{report['delete']['api_calls']} API calls", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cleaner benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    ingest = sub.add_parser('ingest', help='Compare json.load and streaming ingestion')
+    ingest.add_argument('--copies', type=int, default=500,
+                        help='Number of times to repeat the fixture records')
+    ingest.add_argument('--gzip', action='store_true', help='Write the trail gzip-compressed')
+    ingest.set_defaults(func=bench_ingest)
+
+    parallel = sub.add_parser('parallel', help='Scale parsing of a log directory across processes')
+    parallel.add_argument('--files', type=int, default=400, help='Number of log files to generate')
+    parallel.add_argument('--copies', type=int, default=2,
+                          help='Fixture copies per file')
+    parallel.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parallel.set_defaults(func=bench_parallel)
+
+    index = sub.add_parser('index', help='Compare cold and warm runs with the SQLite parse index')
+    index.add_argument('--files', type=int, default=200, help='Number of log files to generate')
+    index.add_argument('--copies', type=int, default=2, help='Fixture copies per file')
+    index.add_argument('--workers', type=int, default=1)
+    index.set_defaults(func=bench_index)
+
+    memory = sub.add_parser('memory', help='Compare bytes per resource of dicts and records')
+    memory.add_argument('--count', type=int, default=200000, help='Resources per type')
+    memory.set_defaults(func=bench_memory)
+
+    discover = sub.add_parser('discover', help='Compare trail scanning and tag discovery')
+    discover.add_argument('--records', type=int, default=200000, help='Trail size to scan')
+    discover.add_argument('--regions', nargs='+', default=['us-east-1', 'eu-west-1', 'ap-south-1'])
+    discover.add_argument('--latency', type=float, default=0.05, help='Seconds per stubbed API call')
+    discover.set_defaults(func=bench_discover)
+
+    suite = sub.add_parser('suite', help='Parse and delete synthetic trails, report as JSON')
+    suite.add_argument('--records', type=int, nargs='+', default=[10000, 100000],
+                       help='Trail sizes to parse (up to 10M)')
+    suite.add_argument('--match-ratio', type=float, default=0.25,
+                       help='Share of records that are matching create events')
+    suite.add_argument('--delete-ratio', type=float, default=0.1,
+                       help='Share of created resources deleted again later in the trail')
+    suite.add_argument('--records-per-file', type=int, default=10000)
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--regions', nargs='+', default=['us-east-1'],
+                       help='Spread copies of the stack across these regions')
+    suite.add_argument('--workers', type=int, default=1, help='Parser processes')
+    suite.add_argument('--delete-records', type=int, default=1000,
+                       help='Size of the trail whose resources are deleted (0 = skip)')
+    suite.add_argument('--latency', type=float, default=0.05, help='Seconds per stubbed API call')
+    suite.add_argument('--throttle-rate', type=float, default=0.02,
+                       help='Share of stubbed API calls that are throttled')
+    suite.add_argument('--bucket-objects', type=int, default=0,
+                       help='Object versions in every stubbed bucket, drained before deleting it')
+    suite.add_argument('--rate-scale', type=float, default=1.0,
+                       help='Multiply the per-service rate limits')
+    suite.add_argument('--output', metavar='PATH', help='Write the JSON report here (default stdout)')
+    suite.set_defaults(func=bench_suite)
+
+    worker = sub.add_parser('_ingest')
+    worker.add_argument('mode')
+    worker.add_argument('path')
+    worker.set_defaults(func=lambda a: run_ingest(a.mode, a.path))
+
+    worker = sub.add_parser('_parse')
+    worker.add_argument('path')
+    worker.add_argument('workers', type=int)
+    worker.set_defaults(func=lambda a: run_parse(a.path, a.workers))
+
+    args = parser.parse_args()
+    args.func(args)
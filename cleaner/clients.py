@@ -0,0 +1,66 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+from drain import DELETE_WORKERS, LIST_WORKERS
+from engine import CLIENT_CONFIG, DEFAULT_LIMIT, GLOBAL_SERVICES, SERVICE_LIMITS, ThrottledClient
+
+# Global services are called through this region's endpoint
+GLOBAL_REGION = 'us-east-1'
+
+# Connections beyond the service's deletion workers, for readiness polling
+# and liveness checks running next to them
+POOL_HEADROOM = 2
+
+
+def _pool_size(service):
+    workers = SERVICE_LIMITS.get(service, DEFAULT_LIMIT)[2]
+    if service == 's3':
+        # Every bucket being deleted is drained by its own list and delete workers
+        workers *= LIST_WORKERS + DELETE_WORKERS
+    return workers + POOL_HEADROOM
+
+
+def _boto3_client(session, service, region, config):
+    return session.client(service, region_name=region, config=config)
+
+
+class ClientPool:
+    """
+    Throttled boto3 clients cached per (profile, region, service).
+
+    profiles maps account IDs to the named profile whose credentials reach
+    that account; other accounts use the default credentials. Each client's
+    connection pool is sized to the service's worker count (times the drain
+    workers for S3), so concurrent deletions do not queue for an HTTP
+    connection. factory(session, service, region, config) builds the
+    underlying client.
+    """
+
+    def __init__(self, profiles=None, factory=_boto3_client):
+        self.profiles = profiles or {}
+        self.factory = factory
+        self.sessions = {}
+        self.clients = {}
+        # boto3 sessions are not safe to create clients from concurrently
+        self.lock = threading.Lock()
+
+    def client(self, service, region=None, account=None):
+        profile = self.profiles.get(account)
+        region = GLOBAL_REGION if service in GLOBAL_SERVICES or not region else region
+        key = (profile, region, service)
+        with self.lock:
+            if key not in self.clients:
+                if profile not in self.sessions:
+                    self.sessions[profile] = boto3.session.Session(profile_name=profile)
+                config = CLIENT_CONFIG.merge(Config(max_pool_connections=_pool_size(service)))
+                self.clients[key] = ThrottledClient(
+                    self.factory(self.sessions[profile], service, region, config),
+                    service, region, profile)
+            return self.clients[key]
+
+    def for_location(self, account, region):
+        """The clients delete_resources needs for one account and region."""
+        return {service: self.client(service, region, account)
+                for service in ('route53', 'ec2', 'iam', 's3', 'logs', 'lambda')}
@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from engine import DEFAULT_LIMIT, GLOBAL_SERVICES, SERVICE_LIMITS
+from liveness import MISSING, instance_states, volume_states
+
+# Seconds between bulk describe calls while nodes wait on resource state
+POLL_INTERVAL = 5
+# Give up on a node whose prerequisite never reaches the wanted state
+WAIT_TIMEOUT = 15 * 60
+
+STATE_FETCHERS = {
+    'instance': instance_states,
+    'volume': volume_states,
+}
+
+
+class DependencyFailed(Exception):
+    pass
+
+
+class Node:
+    """
+    One deletion step in the graph.
+
+    names are the resources the step reports results for, and are what other
+    nodes list in deps. wait_for is a list of (kind, id, states) conditions
+    that must hold after the deps finished, e.g. a volume becoming available
+    once its instance is terminated; they are polled in bulk for all waiting
+    nodes at once.
+    """
+
+    def __init__(self, service, names, action, deps=(), wait_for=()):
+        self.service = service
+        self.names = list(names)
+        self.action = action
+        self.deps = set(deps)
+        self.wait_for = list(wait_for)
+
+
+class ServicePools:
+    """
+    Worker pools sized by SERVICE_LIMITS, shared by the graphs of every
+    location in a run so a service's concurrency cap holds across them.
+    Like the rate limits, global services get one pool per account and the
+    others one per account and region.
+    """
+
+    def __init__(self):
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pool(self, service, account=None, region=None):
+        key = (account, None if service in GLOBAL_SERVICES else region, service)
+        with self.lock:
+            if key not in self.pools:
+                workers = SERVICE_LIMITS.get(service, DEFAULT_LIMIT)[2]
+                self.pools[key] = ThreadPoolExecutor(max_workers=workers,
+                                                     thread_name_prefix=f'delete-{service}')
+            return self.pools[key]
+
+    def shutdown(self):
+        with self.lock:
+            for pool in self.pools.values():
+                pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _poll(ec2, waiting):
+    wanted = {}
+    for node, _ in waiting:
+        for kind, resource_id, _ in node.wait_for:
+            wanted.setdefault(kind, set()).add(resource_id)
+    return {kind: STATE_FETCHERS[kind](ec2, ids) for kind, ids in wanted.items()}
+
+
+def _satisfied(node, states):
+    for kind, resource_id, wanted in node.wait_for:
+        state = states[kind].get(resource_id)
+        if state not in wanted and state != MISSING:
+            return False
+    return True
+
+
+def run_graph(nodes, ec2, poll_interval=POLL_INTERVAL, wait_timeout=WAIT_TIMEOUT, cancel=None,
+              pools=None, location=(None, None)):
+    """
+    Execute deletion nodes in dependency order, yielding (name, error) pairs
+    as results come in.
+
+    A node starts as soon as every name in its deps has been deleted and its
+    wait_for conditions hold, so independent nodes (and services) run in
+    parallel and a dependent does not wait for the rest of its level. If a
+    prerequisite fails, its dependents are reported as skipped.
+
+    Once the cancel event is set no further node is started: queued nodes
+    are dropped without a result, and the run ends when the nodes already
+    in flight have reported.
+
+    Nodes run in the ServicePools given, for the (account, region)
+    location, so graphs run side by side share their service caps; without
+    pools the graph uses its own.
+    """
+    planned = {name for node in nodes for name in node.names}
+    for node in nodes:
+        # Prerequisites that are not part of this run are assumed handled
+        node.deps &= planned
+
+    done = {}
+    blocked = list(nodes)
+    waiting = []
+    running = {}
+    own_pools = pools is None
+    pools = ServicePools() if own_pools else pools
+    last_poll = 0.0
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    def submit(node):
+        if cancelled():
+            return
+        running[pools.pool(node.service, *location).submit(node.action)] = node
+
+    try:
+        while blocked or waiting or running:
+            if cancelled():
+                blocked, waiting = [], []
+                for future in list(running):
+                    if future.cancel():
+                        del running[future]
+                if not running:
+                    break
+
+            # Release every node whose prerequisites have all finished;
+            # skipping a node can unblock (and skip) further nodes
+            progressed = True
+            while progressed:
+                progressed = False
+                still_blocked = []
+                for node in blocked:
+                    if not node.deps <= done.keys():
+                        still_blocked.append(node)
+                        continue
+                    progressed = True
+                    failed = sorted(dep for dep in node.deps if done[dep] is not None)
+                    if failed:
+                        error = DependencyFailed(f"skipped, {failed[0]} was not deleted")
+                        for name in node.names:
+                            done[name] = error
+                            yield name, error
+                    elif node.wait_for:
+                        waiting.append((node, time.monotonic()))
+                    else:
+                        submit(node)
+                blocked = still_blocked
+
+            now = time.monotonic()
+            if waiting and now - last_poll >= poll_interval:
+                last_poll = now
+                try:
+                    states = _poll(ec2, waiting)
+                except (ClientError, BotoCoreError):
+                    # Keep waiting; a persistent failure ends in the timeout
+                    states = None
+                still_waiting = []
+                for node, since in waiting:
+                    if states is not None and _satisfied(node, states):
+                        submit(node)
+                    elif now - since > wait_timeout:
+                        error = TimeoutError(f"timed out after {wait_timeout}s waiting for "
+                                             f"{', '.join(rid for _, rid, _ in node.wait_for)}")
+                        for name in node.names:
+                            done[name] = error
+                            yield name, error
+                    else:
+                        still_waiting.append((node, since))
+                waiting = still_waiting
+                continue
+
+            if not running and not waiting:
+                # Only nodes with unsatisfiable deps are left: a cycle
+                for node in blocked:
+                    for name in node.names:
+                        done[name] = DependencyFailed("skipped, circular dependency")
+                        yield name, done[name]
+                break
+
+            timeout = max(0.0, poll_interval - (time.monotonic() - last_poll)) if waiting else None
+            if not running:
+                if cancel is not None:
+                    cancel.wait(timeout)
+                else:
+                    time.sleep(timeout)
+                continue
+
+            finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = [(name, e) for name in node.names]
+                for name, error in results:
+                    done[name] = error
+                    yield name, error
+                # Names the action did not report on count as failed
+                for name in node.names:
+                    if name not in done:
+                        done[name] = RuntimeError("no result reported")
+                        yield name, done[name]
+    finally:
+        if own_pools:
+            pools.shutdown()
+        else:
+            # Other graphs keep using the pools; only settle this one's nodes
+            for future in running:
+                future.cancel()
+            wait(running)
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from extractors import RESOURCE_TYPES
+from liveness import MISSING, describe_instances
+from records import (Bucket, Instance, LambdaFunction, LogGroup, NetworkInterface,
+                     PlacementGroup, SecurityGroup, Volume, VolumeAttachment)
+
+# GetResources returns at most 100 resources per page
+TAGGING_PAGE_SIZE = 100
+
+# Tagging API resource types the cleaner can delete. IAM and Route53
+# records are not covered by the Tagging API and are only found in trails.
+RESOURCE_TYPE_FILTERS = [
+    'ec2:instance', 'ec2:volume', 'ec2:security-group', 'ec2:network-interface',
+    'ec2:placement-group', 's3:bucket', 'logs:log-group', 'lambda:function',
+]
+
+
+def parse_tag_filters(expressions):
+    """KEY=VALUE[,VALUE...] or KEY (any value) into GetResources TagFilters."""
+    filters = []
+    for expression in expressions:
+        key, _, values = expression.partition('=')
+        if not key:
+            raise ValueError(f"Cannot parse tag filter {expression!r}; expected KEY=VALUE")
+        tag_filter = {'Key': key}
+        if values:
+            tag_filter['Values'] = values.split(',')
+        filters.append(tag_filter)
+    return filters
+
+
+def _tag(tags, key, default=None):
+    return next((tag['Value'] for tag in tags if tag['Key'] == key), default)
+
+
+def _resource(arn, tags):
+    # arn:aws:<service>:<region>:<account>:<resource>; returns (type, record)
+    _, _, service, _, _, resource = arn.split(':', 5)
+    if service == 's3':
+        return 'S3.Buckets.Created', Bucket(bucket_name=resource)
+    if service == 'lambda' and resource.startswith('function:'):
+        return 'Lambda.Function', LambdaFunction(function_name=resource.split(':')[1])
+    if service == 'logs' and resource.startswith('log-group:'):
+        return 'LOGS.LogGroup', LogGroup(log_group_name=resource.split(':')[1])
+    if service == 'ec2':
+        kind, _, resource_id = resource.partition('/')
+        if kind == 'instance':
+            return 'EC2.Instances.Created', Instance(
+                instance_id=resource_id, name=_tag(tags, 'Name', 'Unnamed Instance'))
+        if kind == 'volume':
+            return 'EC2.Volumes.Created', Volume(
+                volume_id=resource_id, name=_tag(tags, 'Name', 'Unnamed Volume'))
+        if kind == 'security-group':
+            return 'EC2.SecurityGroup', SecurityGroup(group_id=resource_id,
+                                                      group_name=_tag(tags, 'Name'))
+        if kind == 'network-interface':
+            return 'EC2.NetworkInterface', NetworkInterface(network_interface_id=resource_id)
+        if kind == 'placement-group':
+            return 'EC2.PlacementGroup', PlacementGroup(placement_group_name=resource_id, arn=arn)
+    return None, None
+
+
+def _describe_instances(ec2, instances, resources):
+    # The Tagging API knows nothing about how instances relate to other
+    # resources; fill in what the deletion plan orders by, and drop
+    # instances that are already terminated or that EC2 no longer knows
+    by_id = {instance.instance_id: instance for instance in instances}
+    live = set()
+    for instance_id, described in describe_instances(ec2, by_id).items():
+        if described == MISSING or described['State']['Name'] == 'terminated':
+            continue
+        instance = by_id[instance_id]
+        live.add(instance_id)
+        instance.placement_group_name = (
+            described.get('Placement') or {}).get('GroupName') or None
+        instance.security_group_ids = tuple(
+            group['GroupId'] for group in described.get('SecurityGroups', []))
+        for mapping in described.get('BlockDeviceMappings', []):
+            if 'Ebs' in mapping:
+                resources['EC2.Volumes.Attached'].append(VolumeAttachment(
+                    volume_id=mapping['Ebs']['VolumeId'],
+                    instance_id=instance_id,
+                    device=mapping['DeviceName'],
+                    region=instance.region, account=instance.account))
+    resources['EC2.Instances.Created'] = [i for i in instances if i.instance_id in live]
+
+
+def discover_location(tagging, ec2, account, region, tag_filters):
+    """Resources in one account and region carrying the tags, keyed like get_resources_to_delete."""
+    resources = {resource_type: [] for resource_type in RESOURCE_TYPES}
+    kwargs = {'TagFilters': tag_filters, 'ResourceTypeFilters': RESOURCE_TYPE_FILTERS,
+              'ResourcesPerPage': TAGGING_PAGE_SIZE}
+    while True:
+        page = tagging.get_resources(**kwargs)
+        for mapping in page['ResourceTagMappingList']:
+            resource_type, resource = _resource(mapping['ResourceARN'], mapping.get('Tags', []))
+            if resource is None:
+                continue
+            resource.region = region
+            # S3 ARNs leave the account out
+            resource.account = mapping['ResourceARN'].split(':')[4] or account or ''
+            resources[resource_type].append(resource)
+        if not page.get('PaginationToken'):
+            break
+        kwargs['PaginationToken'] = page['PaginationToken']
+    if resources['EC2.Instances.Created']:
+        _describe_instances(ec2, resources['EC2.Instances.Created'], resources)
+    return resources
+
+
+def discover_resources(clients, regions, tag_filters, accounts=(None,)):
+    """
+    Find deletable resources by tag with the Resource Groups Tagging API
+    instead of reading CloudTrail, one thread per account and region.
+    accounts select the credentials ClientPool uses; None is the default
+    profile. Returns the same {type: [records]} mapping as
+    get_resources_to_delete.
+    """
+    locations = [(account, region) for account in accounts for region in regions]
+
+    def discover(location):
+        account, region = location
+        return discover_location(clients.client('resourcegroupstaggingapi', region, account),
+                                 clients.client('ec2', region, account), account, region,
+                                 tag_filters)
+
+    resources = {resource_type: [] for resource_type in RESOURCE_TYPES}
+    with ThreadPoolExecutor(max_workers=max(1, len(locations)),
+                            thread_name_prefix='discover') as executor:
+        for found in executor.map(discover, locations):
+            for resource_type, located in found.items():
+                resources[resource_type].extend(located)
+    return resources
+
+
+def enabled_regions(ec2):
+    return sorted(region['RegionName'] for region in ec2.describe_regions()['Regions'])
@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import chunks
+
+# DeleteObjects takes at most 1000 keys per request
+DELETE_OBJECTS_BATCH = 1000
+# Per bucket: prefixes listed at once, and delete_objects calls in flight
+LIST_WORKERS = 4
+DELETE_WORKERS = 8
+# Listed batches waiting for a delete worker; listing pauses beyond this
+MAX_PENDING_BATCHES = DELETE_WORKERS * 4
+# Seconds between progress reports while a bucket drains
+PROGRESS_INTERVAL = 10
+
+
+class DrainStats:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.objects = 0
+        self.bytes = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-9)
+
+    def __str__(self):
+        return (f"{self.objects} objects, {self.bytes / (1024 * 1024):.1f} MB freed in "
+                f"{self.elapsed:.1f}s ({self.objects / self.elapsed:.0f} objects/sec)")
+
+
+def _version_pages(s3, bucket, **kwargs):
+    # Manual pagination so each page goes through the throttled client
+    kwargs['Bucket'] = bucket
+    while True:
+        page = s3.list_object_versions(**kwargs)
+        yield page
+        if not page.get('IsTruncated'):
+            return
+        kwargs['KeyMarker'] = page['NextKeyMarker']
+        if page.get('NextVersionIdMarker'):
+            kwargs['VersionIdMarker'] = page['NextVersionIdMarker']
+
+
+def drain_bucket(s3, bucket, progress=None):
+    """
+    Delete every object version and delete marker in a bucket, so that
+    delete_bucket can succeed.
+
+    The top-level prefixes are listed concurrently by LIST_WORKERS threads
+    and every listed page is deleted in 1000-key delete_objects batches by
+    DELETE_WORKERS threads while listing goes on. progress(stats) is called
+    at most every PROGRESS_INTERVAL seconds. Returns DrainStats; keys that
+    could not be deleted are in stats.errors.
+    """
+    stats = DrainStats(bucket)
+    pending = threading.BoundedSemaphore(MAX_PENDING_BATCHES)
+
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS,
+                            thread_name_prefix=f'drain-delete-{bucket}') as deleters:
+
+        def delete(batch):
+            try:
+                response = s3.delete_objects(Bucket=bucket, Delete={
+                    'Objects': [{'Key': key, 'VersionId': version} for key, version, _ in batch],
+                    'Quiet': True})
+            finally:
+                pending.release()
+            failed = {(error['Key'], error.get('VersionId')) for error in response.get('Errors', [])}
+            with stats.lock:
+                stats.errors.extend(response.get('Errors', []))
+                for key, version, size in batch:
+                    if (key, version) not in failed:
+                        stats.objects += 1
+                        stats.bytes += size
+                report = progress and time.monotonic() - stats.reported >= PROGRESS_INTERVAL
+                if report:
+                    stats.reported = time.monotonic()
+            if report:
+                progress(stats)
+
+        def submit(page):
+            listed = [(v['Key'], v['VersionId'], v.get('Size', 0)) for v in page.get('Versions', [])]
+            listed += [(m['Key'], m['VersionId'], 0) for m in page.get('DeleteMarkers', [])]
+            futures = []
+            for batch in chunks(listed, DELETE_OBJECTS_BATCH):
+                pending.acquire()
+                futures.append(deleters.submit(delete, batch))
+            return futures
+
+        def drain_prefix(prefix):
+            futures = []
+            for page in _version_pages(s3, bucket, Prefix=prefix):
+                futures.extend(submit(page))
+            return futures
+
+        # One delimited listing finds the top-level prefixes and the keys
+        # directly at the root; each prefix is then listed on its own
+        futures, prefixes = [], []
+        for page in _version_pages(s3, bucket, Delimiter='/'):
+            futures.extend(submit(page))
+            prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+
+        with ThreadPoolExecutor(max_workers=LIST_WORKERS,
+                                thread_name_prefix=f'drain-list-{bucket}') as listers:
+            for prefix_futures in listers.map(drain_prefix, prefixes):
+                futures.extend(prefix_futures)
+
+        for future in futures:
+            future.result()
+    return stats
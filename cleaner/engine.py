@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from batching import THROTTLE_CODES
+from metrics import METRICS
+
+# service: (requests/sec, burst, concurrent workers). Rates follow the
+# published control-plane limits: Route53 is 5 req/s per account, EC2
+# mutating actions refill at 5/s, CloudWatch Logs DeleteLogGroup is 10 TPS.
+SERVICE_LIMITS = {
+    'route53': (5, 5, 1),
+    'ec2': (5, 10, 8),
+    'iam': (10, 10, 4),
+    's3': (50, 50, 8),
+    'logs': (10, 10, 4),
+    'lambda': (10, 10, 4),
+    # LookupEvents allows 2 requests/sec per account and region
+    'cloudtrail': (2, 2, 4),
+}
+DEFAULT_LIMIT = (5, 5, 2)
+
+# Services with one endpoint and one set of limits per account; the others
+# are limited per region
+GLOBAL_SERVICES = {'iam', 'route53'}
+
+# Transient errors worth retrying; only THROTTLE_CODES slow the bucket down
+RETRYABLE_CODES = THROTTLE_CODES | {'InternalError', 'InternalFailure',
+                                    'ServiceUnavailable', 'RequestTimeout'}
+MAX_ATTEMPTS = 8
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 30
+# Never back off below this fraction of the published rate
+MIN_RATE_FRACTION = 0.05
+# Additive increase per successful call, as a fraction of the published rate
+RATE_RECOVERY = 0.05
+
+# botocore would otherwise retry throttles itself, underneath our limiter
+CLIENT_CONFIG = Config(retries={'total_max_attempts': 1})
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with AIMD rate adaptation: the refill rate is
+    halved on every throttle and creeps back up to the published limit as
+    calls succeed.
+    """
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttles = 0
+        self.retries = 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.calls += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        with self.lock:
+            self.throttles += 1
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            # Drain the burst so waiting callers do not fire straight away
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(service, region=None, profile=None):
+    key = (profile, None if service in GLOBAL_SERVICES else region, service)
+    with _buckets_lock:
+        if key not in _buckets:
+            rate, burst, _ = SERVICE_LIMITS.get(service, DEFAULT_LIMIT)
+            _buckets[key] = TokenBucket(rate, burst)
+        return _buckets[key]
+
+
+def call_with_retry(bucket, func, *args, **kwargs):
+    for attempt in range(MAX_ATTEMPTS):
+        bucket.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code not in RETRYABLE_CODES or attempt == MAX_ATTEMPTS - 1:
+                raise
+            if code in THROTTLE_CODES:
+                bucket.throttled()
+            with bucket.lock:
+                bucket.retries += 1
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            time.sleep(random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)))
+            continue
+        bucket.succeeded()
+        return result
+
+
+class ThrottledClient:
+    """
+    Wrap a boto3 client so every API call goes through the service's token
+    bucket and is retried with backoff when throttled. Every attempt is
+    timed into METRICS.
+    """
+
+    PASSTHROUGH = {'get_paginator', 'get_waiter', 'can_paginate', 'close'}
+
+    def __init__(self, client, service, region=None, profile=None):
+        self._client = client
+        self._service = service
+        self._bucket = bucket_for(service, region, profile)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name in self.PASSTHROUGH or not callable(attr):
+            return attr
+
+        timed = METRICS.timed(self._service, name, attr)
+
+        def call(*args, **kwargs):
+            return call_with_retry(self._bucket, timed, *args, **kwargs)
+        return call
+
+
+def delete_one(name, func, **kwargs):
+    try:
+        func(**kwargs)
+        return [(name, None)]
+    except (ClientError, BotoCoreError) as e:
+        return [(name, e)]
+
+
+def throttle_summary():
+    # Keyed 'service', 'service region' or 'service region (profile)'
+    with _buckets_lock:
+        return {' '.join(filter(None, (service, region, profile and f'({profile})'))): {
+                    'calls': b.calls, 'retries': b.retries,
+                    'throttles': b.throttles, 'rate': round(b.rate, 2)}
+                for (profile, region, service), b in _buckets.items()}
@@ -0,0 +1,510 @@
+import sys
+
+from records import (Bucket, Instance, InstanceProfile, InstanceProfileRole, LambdaFunction,
+                     LogGroup, LogStream, NetworkInterface, PlacementGroup, Role,
+                     Route53Record, SecurityGroup, Volume, VolumeAttachment)
+
+# Resource types in the order they are reported, with a human readable label
+RESOURCE_TYPES = {
+    'Route53': 'Route53 records',
+    'EC2.Volumes.Attached': 'EC2 volumes Attached',
+    'EC2.Volumes.Created': 'EC2 volumes Created',
+    'IAM.InstanceProfile': 'IAM instance profiles',
+    'IAM.Role': 'IAM roles',
+    'IAM.InstanceProfile.Roles': 'IAM roles added to instance profiles',
+    'S3.Buckets.Created': 'S3 buckets',
+    'EC2.PlacementGroup': 'EC2 placement groups',
+    'EC2.Instances.Created': 'EC2 instances',
+    'LOGS.LogStream': 'CloudWatch log streams',
+    'LOGS.LogGroup': 'CloudWatch log groups',
+    'EC2.SecurityGroup': 'EC2 security groups',
+    'EC2.NetworkInterface': 'EC2 network interfaces',
+    'Lambda.Function': 'Lambda functions',
+}
+
+
+# Record class of each resource type
+RESOURCE_RECORDS = {
+    'Route53': Route53Record,
+    'EC2.Volumes.Attached': VolumeAttachment,
+    'EC2.Volumes.Created': Volume,
+    'IAM.InstanceProfile': InstanceProfile,
+    'IAM.Role': Role,
+    'IAM.InstanceProfile.Roles': InstanceProfileRole,
+    'S3.Buckets.Created': Bucket,
+    'EC2.PlacementGroup': PlacementGroup,
+    'EC2.Instances.Created': Instance,
+    'LOGS.LogStream': LogStream,
+    'LOGS.LogGroup': LogGroup,
+    'EC2.SecurityGroup': SecurityGroup,
+    'EC2.NetworkInterface': NetworkInterface,
+    'Lambda.Function': LambdaFunction,
+}
+
+
+def _route53_key(r):
+    return r.hosted_zone_id, r.name.rstrip('.').lower(), r.type
+
+
+# How to identify one resource of each type across create/modify/delete events
+RESOURCE_KEYS = {
+    'Route53': _route53_key,
+    'EC2.Volumes.Attached': lambda r: (r.volume_id, r.instance_id),
+    'EC2.Volumes.Created': lambda r: r.volume_id,
+    'IAM.InstanceProfile': lambda r: r.instance_profile_name,
+    'IAM.Role': lambda r: r.role_name,
+    'IAM.InstanceProfile.Roles': lambda r: (r.instance_profile_name, r.role_name),
+    'S3.Buckets.Created': lambda r: r.bucket_name,
+    'EC2.PlacementGroup': lambda r: r.placement_group_name,
+    'EC2.Instances.Created': lambda r: r.instance_id,
+    'LOGS.LogStream': lambda r: (r.log_group_name, r.log_stream_name),
+    'LOGS.LogGroup': lambda r: r.log_group_name,
+    'EC2.SecurityGroup': lambda r: r.group_id,
+    'EC2.NetworkInterface': lambda r: r.network_interface_id,
+    'Lambda.Function': lambda r: r.function_name,
+}
+
+# What a resource is called in listings and deletion results
+RESOURCE_NAMES = {
+    'Route53': lambda r: f"{r.name} ({r.type})",
+    'EC2.Volumes.Attached': lambda r: f"{r.volume_id} on {r.instance_id}",
+    'EC2.Volumes.Created': lambda r: r.volume_id,
+    'IAM.InstanceProfile': lambda r: r.arn,
+    'IAM.Role': lambda r: r.arn,
+    'IAM.InstanceProfile.Roles': lambda r: f"{r.role_name} in {r.instance_profile_name}",
+    'S3.Buckets.Created': lambda r: r.bucket_name,
+    'EC2.PlacementGroup': lambda r: r.placement_group_name,
+    'EC2.Instances.Created': lambda r: r.instance_id,
+    'LOGS.LogStream': lambda r: f"{r.log_group_name}/{r.log_stream_name}",
+    'LOGS.LogGroup': lambda r: r.log_group_name,
+    'EC2.SecurityGroup': lambda r: r.group_id,
+    'EC2.NetworkInterface': lambda r: r.network_interface_id,
+    'Lambda.Function': lambda r: r.function_name,
+}
+
+
+
+def resource_key(resource_type, resource):
+    # Names such as placement or log groups are only unique per region
+    return resource.account, resource.region, RESOURCE_KEYS[resource_type](resource)
+
+
+CREATE = 'create'
+MODIFY = 'modify'
+DELETE = 'delete'
+# Breaks eventTime ties (one-second resolution): a create and delete in the
+# same second almost always happened in that order
+_ACTION_RANK = {CREATE: 0, MODIFY: 1, DELETE: 2}
+DELETE_RANK = _ACTION_RANK[DELETE]
+
+# (eventSource, eventName) -> (resource type, action, extractor). Every
+# record costs one dict lookup, so the Describe*/Get*/List* bulk of a trail
+# is rejected without looking at its parameters.
+EXTRACTORS = {}
+
+
+def extractor(event_source, event_name, resource_type, action=CREATE):
+    """
+    Register a function that turns a matching CloudTrail record into zero or
+    more records (see RESOURCE_RECORDS) of the given type. Delete extractors only need to
+    return the fields used by the type's key. With action=None the function
+    returns (action, resource) pairs itself.
+    """
+    if resource_type not in RESOURCE_TYPES:
+        raise ValueError(f"Unknown resource type {resource_type}")
+
+    def register(func):
+        EXTRACTORS[(event_source, event_name)] = (resource_type, action, func)
+        return func
+    return register
+
+
+def new_resources():
+    return {resource_type: [] for resource_type in RESOURCE_TYPES}
+
+
+def by_location(resources):
+    """Split resources into {(account, region): resources} by where they were created."""
+    locations = {}
+    for resource_type, found in resources.items():
+        for resource in found:
+            location = (resource.account, resource.region)
+            if location not in locations:
+                locations[location] = new_resources()
+            locations[location][resource_type].append(resource)
+    return locations
+
+
+def merge_locations(locations):
+    resources = new_resources()
+    for located in locations.values():
+        for resource_type, found in located.items():
+            resources[resource_type].extend(found)
+    return resources
+
+
+class NetState:
+    """
+    Index of every resource seen in the trail, keyed by (type, (account,
+    region, identifier)); resources are tagged with the record's account
+    and region.
+
+    Each entry keeps the newest create time, the newest delete time and the
+    payload of the newest create/modify event. Because every field only ever
+    moves forward in time, records can be applied in any order (overlapping
+    or out-of-order log files) in one linear pass, and two indexes built
+    from different files merge the same way. A resource survives if its
+    newest create is later than its newest delete; duplicates collapse onto
+    the same key.
+    """
+
+    def __init__(self):
+        # (resource type, key) -> [created_at, deleted_at, data_at, data]
+        self.index = {}
+        # (event source, event name) -> [records matched, resources found]
+        self.matched = {}
+
+    def apply(self, record):
+        event = (record.get('eventSource'), record.get('eventName'))
+        entry = EXTRACTORS.get(event)
+        if entry is None:
+            return 0
+        resource_type, action, func = entry
+        found = func(record)
+        if action is not None:
+            found = [(action, resource) for resource in found]
+        matched = self.matched.get(event)
+        if matched is None:
+            matched = self.matched[event] = [0, 0]
+        matched[0] += 1
+        matched[1] += len(found)
+
+        event_time = record.get('eventTime', '')
+        region = sys.intern(record.get('awsRegion') or '')
+        account = sys.intern(record.get('recipientAccountId')
+                             or (record.get('userIdentity') or {}).get('accountId') or '')
+        for found_action, resource in found:
+            resource.region = region
+            resource.account = account
+            at = (event_time, _ACTION_RANK[found_action])
+            self._update((resource_type, resource_key(resource_type, resource)),
+                         found_action, at, resource)
+        return len(found)
+
+    def _update(self, key, action, at, resource):
+        state = self.index.get(key)
+        if state is None:
+            state = self.index[key] = [None, None, None, None]
+        if action == DELETE:
+            if state[1] is None or at > state[1]:
+                state[1] = at
+            return
+        if action == CREATE and (state[0] is None or at > state[0]):
+            state[0] = at
+        if state[2] is None or at > state[2]:
+            state[2] = at
+            state[3] = resource
+
+    def merge(self, other):
+        for key, entry in other.index.items():
+            self.merge_entry(key, entry)
+        for event, (records, resources) in other.matched.items():
+            matched = self.matched.setdefault(event, [0, 0])
+            matched[0] += records
+            matched[1] += resources
+
+    def merge_entry(self, key, entry):
+        created_at, deleted_at, data_at, data = entry
+        if created_at is not None:
+            self._update(key, CREATE, created_at, data)
+            if data_at > created_at:
+                self._update(key, MODIFY, data_at, data)
+        elif data_at is not None:
+            self._update(key, MODIFY, data_at, data)
+        if deleted_at is not None:
+            self._update(key, DELETE, deleted_at, None)
+
+    def resources(self):
+        resources = new_resources()
+        for (resource_type, _), (created_at, deleted_at, _, data) in self.index.items():
+            if created_at is not None and (deleted_at is None or deleted_at < created_at):
+                resources[resource_type].append(data)
+        return resources
+
+
+def _tag_value(container, key, default):
+    items = ((container or {}).get('tagSet') or {}).get('items') or []
+    return next((item['value'] for item in items if item['key'] == key), default)
+
+
+_ROUTE53_ACTIONS = {'CREATE': CREATE, 'UPSERT': MODIFY, 'DELETE': DELETE}
+
+
+@extractor('route53.amazonaws.com', 'ChangeResourceRecordSets', 'Route53', action=None)
+def route53_records(record):
+    params = record.get('requestParameters')
+    if not params or 'changes' not in (params.get('changeBatch') or {}):
+        return []
+    found = []
+    for change in params['changeBatch']['changes']:
+        if change['action'] in _ROUTE53_ACTIONS:
+            rr_set = change['resourceRecordSet']
+            alias = rr_set.get('aliasTarget')
+            found.append((_ROUTE53_ACTIONS[change['action']], Route53Record(
+                hosted_zone_id=params['hostedZoneId'],
+                name=rr_set['name'],
+                type=rr_set['type'],
+                ttl=None if alias else rr_set.get('tTL', 300),
+                values=tuple(rr['value'] for rr in rr_set.get('resourceRecords', [])),
+                alias_target=(alias['hostedZoneId'], alias.get('dNSName', alias.get('dnsName')),
+                              bool(alias.get('evaluateTargetHealth'))) if alias else None
+            )))
+    return found
+
+
+@extractor('ec2.amazonaws.com', 'AttachVolume', 'EC2.Volumes.Attached')
+def attached_volume(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [VolumeAttachment(
+        volume_id=params['volumeId'],
+        instance_id=params['instanceId'],
+        device=params['device']
+    )]
+
+
+@extractor('ec2.amazonaws.com', 'DetachVolume', 'EC2.Volumes.Attached', DELETE)
+def detached_volume(record):
+    # Detaching without naming the instance is allowed; the response has it
+    params = record.get('requestParameters')
+    response = record.get('responseElements') or {}
+    if params is None or not (params.get('instanceId') or response.get('instanceId')):
+        return []
+    return [VolumeAttachment(
+        volume_id=params['volumeId'],
+        instance_id=params.get('instanceId') or response['instanceId']
+    )]
+
+
+@extractor('ec2.amazonaws.com', 'CreateVolume', 'EC2.Volumes.Created')
+def created_volume(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    return [Volume(
+        volume_id=response['volumeId'],
+        name=_tag_value(response, 'Name', 'Unnamed Volume')
+    )]
+
+
+@extractor('ec2.amazonaws.com', 'DeleteVolume', 'EC2.Volumes.Created', DELETE)
+def deleted_volume(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [Volume(volume_id=params['volumeId'])]
+
+
+@extractor('s3.amazonaws.com', 'CreateBucket', 'S3.Buckets.Created')
+def created_bucket(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [Bucket(bucket_name=params['bucketName'])]
+
+
+@extractor('s3.amazonaws.com', 'DeleteBucket', 'S3.Buckets.Created', DELETE)
+def deleted_bucket(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [Bucket(bucket_name=params['bucketName'])]
+
+
+@extractor('ec2.amazonaws.com', 'CreatePlacementGroup', 'EC2.PlacementGroup')
+def created_placement_group(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    group = response['placementGroup']
+    return [PlacementGroup(placement_group_name=group['groupName'], arn=group['groupArn'])]
+
+
+@extractor('ec2.amazonaws.com', 'DeletePlacementGroup', 'EC2.PlacementGroup', DELETE)
+def deleted_placement_group(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [PlacementGroup(placement_group_name=params['groupName'])]
+
+
+@extractor('iam.amazonaws.com', 'CreateInstanceProfile', 'IAM.InstanceProfile')
+def created_instance_profile(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    profile = response['instanceProfile']
+    return [InstanceProfile(instance_profile_name=profile['instanceProfileName'],
+                            arn=profile['arn'])]
+
+
+@extractor('iam.amazonaws.com', 'DeleteInstanceProfile', 'IAM.InstanceProfile', DELETE)
+def deleted_instance_profile(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [InstanceProfile(instance_profile_name=params['instanceProfileName'])]
+
+
+@extractor('iam.amazonaws.com', 'CreateRole', 'IAM.Role')
+def created_role(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    role = response['role']
+    return [Role(role_name=role['roleName'], arn=role['arn'])]
+
+
+@extractor('iam.amazonaws.com', 'DeleteRole', 'IAM.Role', DELETE)
+def deleted_role(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [Role(role_name=params['roleName'])]
+
+
+@extractor('iam.amazonaws.com', 'AddRoleToInstanceProfile', 'IAM.InstanceProfile.Roles')
+def role_added_to_instance_profile(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [InstanceProfileRole(
+        instance_profile_name=params['instanceProfileName'],
+        role_name=params['roleName']
+    )]
+
+
+@extractor('iam.amazonaws.com', 'RemoveRoleFromInstanceProfile', 'IAM.InstanceProfile.Roles', DELETE)
+def role_removed_from_instance_profile(record):
+    return role_added_to_instance_profile(record)
+
+
+@extractor('ec2.amazonaws.com', 'RunInstances', 'EC2.Instances.Created')
+def run_instances(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    params = record.get('requestParameters') or {}
+    # One RunInstances call can launch many instances; keep all of them.
+    # Placement group and security groups are kept to order deletions.
+    return [Instance(
+        instance_id=item['instanceId'],
+        name=_tag_value(item, 'Name', 'Unnamed Instance'),
+        placement_group_name=(item.get('placement') or {}).get('groupName',
+                                                               params.get('placementGroupName')),
+        security_group_ids=[group['groupId'] for group in
+                            (item.get('groupSet') or {}).get('items') or []]
+    ) for item in response['instancesSet']['items']]
+
+
+@extractor('ec2.amazonaws.com', 'TerminateInstances', 'EC2.Instances.Created', DELETE)
+def terminated_instances(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [Instance(instance_id=item['instanceId'])
+            for item in (params.get('instancesSet') or {}).get('items', [])]
+
+
+@extractor('logs.amazonaws.com', 'CreateLogStream', 'LOGS.LogStream')
+def created_log_stream(record):
+    # CreateLogStream returns no response body, the names are in the request
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [LogStream(
+        log_group_name=params['logGroupName'],
+        log_stream_name=params['logStreamName']
+    )]
+
+
+@extractor('logs.amazonaws.com', 'DeleteLogStream', 'LOGS.LogStream', DELETE)
+def deleted_log_stream(record):
+    return created_log_stream(record)
+
+
+@extractor('logs.amazonaws.com', 'CreateLogGroup', 'LOGS.LogGroup')
+def created_log_group(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [LogGroup(log_group_name=params['logGroupName'])]
+
+
+@extractor('logs.amazonaws.com', 'DeleteLogGroup', 'LOGS.LogGroup', DELETE)
+def deleted_log_group(record):
+    return created_log_group(record)
+
+
+@extractor('ec2.amazonaws.com', 'CreateSecurityGroup', 'EC2.SecurityGroup')
+def created_security_group(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    params = record.get('requestParameters') or {}
+    return [SecurityGroup(
+        group_id=response['groupId'],
+        group_name=params.get('groupName', response['groupId'])
+    )]
+
+
+@extractor('ec2.amazonaws.com', 'DeleteSecurityGroup', 'EC2.SecurityGroup', DELETE)
+def deleted_security_group(record):
+    # Groups deleted by name only cannot be matched to the created group ID
+    params = record.get('requestParameters')
+    if params is None or 'groupId' not in params:
+        return []
+    return [SecurityGroup(group_id=params['groupId'])]
+
+
+@extractor('ec2.amazonaws.com', 'CreateNetworkInterface', 'EC2.NetworkInterface')
+def created_network_interface(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    return [NetworkInterface(
+        network_interface_id=response['networkInterface']['networkInterfaceId'])]
+
+
+@extractor('ec2.amazonaws.com', 'DeleteNetworkInterface', 'EC2.NetworkInterface', DELETE)
+def deleted_network_interface(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    return [NetworkInterface(network_interface_id=params['networkInterfaceId'])]
+
+
+def _created_function(record):
+    response = record.get('responseElements')
+    if response is None:
+        return []
+    return [LambdaFunction(function_name=response['functionName'])]
+
+
+def _deleted_function(record):
+    params = record.get('requestParameters')
+    if params is None:
+        return []
+    # DeleteFunction accepts a name or an ARN (arn:aws:lambda:region:acct:function:name)
+    name = params['functionName']
+    if name.startswith('arn:'):
+        name = name.split(':')[6]
+    return [LambdaFunction(function_name=name)]
+
+
+# Lambda records carry the API version in the event name
+for _event_name in ('CreateFunction', 'CreateFunction20150331'):
+    extractor('lambda.amazonaws.com', _event_name, 'Lambda.Function')(_created_function)
+for _event_name in ('DeleteFunction', 'DeleteFunction20150331'):
+    extractor('lambda.amazonaws.com', _event_name, 'Lambda.Function', DELETE)(_deleted_function)
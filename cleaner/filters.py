@@ -0,0 +1,198 @@
+import os
+import re
+import shlex
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+
+from trail import CHUNK_SIZE, open_trail_file
+
+# CloudTrail names delivered files <account>_CloudTrail_<region>_<YYYYMMDDTHHmmZ>_<id>.json.gz
+_TRAIL_FILE_NAME = re.compile(r'\d{12}_CloudTrail_([a-z0-9-]+)_(\d{8}T\d{4}Z)_')
+# CloudTrail's eventTime format; times compare as text in it
+_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# How far events may lie from the delivery time in a file's name
+FILE_TIME_SLACK = timedelta(hours=1)
+
+# Literal text only counts for the raw pre-check if JSON never escapes it
+_RAW_SAFE = re.compile(r'[A-Za-z0-9 _.:@+=-]+')
+# Bytes read at a time by the raw pre-check
+PRECHECK_CHUNK_SIZE = CHUNK_SIZE * 16
+
+FIELDS = {
+    'arn': lambda record: (record.get('userIdentity') or {}).get('arn'),
+    'agent': lambda record: record.get('userAgent'),
+    'region': lambda record: record.get('awsRegion'),
+}
+
+
+def parse_time(value):
+    """A date or UTC time as typed on the command line, as a naive UTC datetime."""
+    for layout in ('%Y-%m-%d', '%Y-%m-%dT%H:%MZ', '%Y-%m-%dT%H:%M', _TIME_FORMAT, '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value, layout)
+        except ValueError:
+            pass
+    raise ValueError(f"Expected a date or YYYY-MM-DDTHH:MM[:SS]Z time, got {value!r}")
+
+
+def _event_time(value):
+    # In CloudTrail's eventTime format, so it compares as text
+    return parse_time(value).strftime(_TIME_FORMAT)
+
+
+def _collect_tags(value, tags):
+    if isinstance(value, list):
+        for item in value:
+            _collect_tags(item, tags)
+    elif isinstance(value, dict):
+        key = value.get('key', value.get('Key'))
+        if isinstance(key, str) and ('value' in value or 'Value' in value):
+            tags.append((key, str(value.get('value', value.get('Value')))))
+            return
+        for name, item in value.items():
+            if name.lower() == 'tags' and isinstance(item, dict) and all(
+                    isinstance(v, str) for v in item.values()):
+                tags.extend(item.items())
+            else:
+                _collect_tags(item, tags)
+
+
+def record_tags(record):
+    """(key, value) pairs of every tag in a record's request, in any of the shapes services use."""
+    tags = []
+    _collect_tags(record.get('requestParameters'), tags)
+    return tags
+
+
+def _literal(pattern):
+    # The longest text every match of the glob must contain verbatim
+    runs = [run for part in re.split(r'[*?]|\[[^]]*\]', pattern) for run in _RAW_SAFE.findall(part)]
+    return max(runs, key=len, default='')
+
+
+class RecordFilter:
+    """
+    A filter expression compiled into record predicates.
+
+    The expression is a list of clauses that must all hold; each clause is
+    `field=pattern[,pattern...]` (any pattern matches) or `field!=...`:
+
+        since=2025-01-28        eventTime at or after this date or time
+        until=2025-01-29T12:00Z eventTime before this
+        region=us-east-1,eu-*   awsRegion
+        arn=*/Combine-TS-WLDEVELOPER/*   userIdentity.arn
+        agent=*Terraform*       userAgent
+        tag:Owner=alice         a tag in the request parameters
+
+    Patterns are case-sensitive shell globs; quote them to include spaces.
+
+    Before any JSON is decoded, whole files can be ruled out: by the region
+    and delivery time in CloudTrail's file names, and by scanning the raw
+    bytes for text that every matching record must contain.
+    """
+
+    def __init__(self, expressions):
+        if isinstance(expressions, str):
+            expressions = [expressions]
+        self.expressions = list(expressions)
+        self.since = self.until = None
+        self.regions = []
+        self.predicates = []
+        # One tuple per clause; a matching record contains one of its literals
+        self.literals = []
+        for expression in self.expressions:
+            for clause in shlex.split(expression):
+                self._compile(clause)
+        # Cheapest first: region and time are plain lookups
+        self.predicates.sort(key=lambda predicate: predicate[0])
+
+    def _compile(self, clause):
+        match = re.fullmatch(r'(since|until|region|arn|agent|tag:[^=!]+)(!?=)(.*)', clause)
+        if not match:
+            raise ValueError(f"Cannot parse filter clause {clause!r}; expected field=pattern")
+        field, op, value = match.groups()
+        negate = op == '!='
+        if field in ('since', 'until'):
+            if negate:
+                raise ValueError(f"{field} does not take !=")
+            bound = _event_time(value)
+            if field == 'since':
+                self.since = max(self.since or bound, bound)
+                self.predicates.append((1, lambda record: record.get('eventTime', '') >= bound))
+            else:
+                self.until = min(self.until or bound, bound)
+                self.predicates.append((1, lambda record: record.get('eventTime', '') < bound))
+            return
+
+        patterns = [pattern for pattern in value.split(',') if pattern]
+        if not patterns:
+            raise ValueError(f"Filter clause {clause!r} has no pattern")
+
+        def matches(text):
+            return text is not None and any(fnmatchcase(text, pattern) for pattern in patterns)
+
+        if field.startswith('tag:'):
+            tag_key = field[4:]
+
+            def predicate(record):
+                return any(fnmatchcase(key, tag_key) and matches(tag_value)
+                           for key, tag_value in record_tags(record)) != negate
+            self.predicates.append((3, predicate))
+            literals = [_literal(pattern) for pattern in patterns]
+            if not all(literals):
+                literals = [_literal(tag_key)]
+        else:
+            get = FIELDS[field]
+            self.predicates.append((0 if field == 'region' else 2,
+                                    lambda record: matches(get(record)) != negate))
+            literals = [_literal(pattern) for pattern in patterns]
+            if field == 'region' and not negate:
+                self.regions.extend(patterns)
+        if not negate and all(literals):
+            self.literals.append(tuple(literal.encode() for literal in literals))
+
+    def __call__(self, record):
+        for _, predicate in self.predicates:
+            if not predicate(record):
+                return False
+        return True
+
+    def skip_by_name(self, path):
+        """True if CloudTrail's file name shows no record in it can match."""
+        match = _TRAIL_FILE_NAME.match(os.path.basename(path))
+        if not match:
+            return False
+        region, stamp = match.groups()
+        if self.regions and not any(fnmatchcase(region, pattern) for pattern in self.regions):
+            return True
+        delivered = datetime.strptime(stamp, '%Y%m%dT%H%MZ')
+        if self.since and (delivered + FILE_TIME_SLACK).strftime(_TIME_FORMAT) < self.since:
+            return True
+        if self.until and (delivered - FILE_TIME_SLACK).strftime(_TIME_FORMAT) >= self.until:
+            return True
+        return False
+
+    def may_match_file(self, path):
+        """
+        Scan a file's raw (decompressed) bytes for the literal text of the
+        clauses; False means no record in it can match. Stops reading as soon
+        as every clause has been seen once.
+        """
+        if not self.literals:
+            return True
+        pending = list(self.literals)
+        overlap = max(len(literal) for literals in pending for literal in literals) - 1
+        tail = b''
+        with open_trail_file(path, binary=True) as f:
+            while pending:
+                chunk = f.read(PRECHECK_CHUNK_SIZE)
+                if not chunk:
+                    return False
+                data = tail + chunk
+                pending = [literals for literals in pending
+                           if not any(literal in data for literal in literals)]
+                tail = data[-overlap:] if overlap else b''
+        return True
+
+    def skip_file(self, path):
+        return self.skip_by_name(path) or not self.may_match_file(path)
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from extractors import DELETE_RANK, RESOURCE_RECORDS, NetState
+
+# Bump when the stored entry format changes; older indexes are rebuilt
+SCHEMA_VERSION = 4
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    records INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    resource_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_path ON entries(path);
+CREATE TABLE IF NOT EXISTS deletions (
+    resource_type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (resource_type, key)
+);
+'''
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _utc_now():
+    # Same format as CloudTrail eventTime, so it orders against event times
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def _tuples(value):
+    return tuple(_tuples(item) for item in value) if isinstance(value, list) else value
+
+
+def _key_from_json(text):
+    return _tuples(json.loads(text))
+
+
+def _at_from_json(value):
+    return tuple(value) if value is not None else None
+
+
+class ParseIndex:
+    """
+    On-disk index of already parsed CloudTrail files (SQLite).
+
+    For every file it keeps size, mtime and SHA-256 together with the
+    NetState entries extracted from it, so a re-run only parses files that
+    are new or whose content changed. Each file is written in a single
+    transaction, which makes the index safe to reuse after an interrupted
+    run: a file is either fully indexed or parsed again.
+
+    Deletion outcomes are stored as well; a successful deletion is fed back
+    as a delete event so the resource is not reported again unless the
+    trail shows it being created afterwards.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript('DROP TABLE IF EXISTS entries; DROP TABLE IF EXISTS files; '
+                                    'DROP TABLE IF EXISTS deletions;')
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def file_signature(self, path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def is_current(self, path):
+        path = os.path.abspath(path)
+        row = self.conn.execute('SELECT size, mtime_ns, sha256 FROM files WHERE path = ?',
+                                (path,)).fetchone()
+        if row is None:
+            return False
+        size, mtime_ns = self.file_signature(path)
+        if (size, mtime_ns) == (row[0], row[1]):
+            return True
+        # Touched or copied but unchanged: refresh the stat and keep it
+        if size == row[0] and file_digest(path) == row[2]:
+            with self.conn:
+                self.conn.execute('UPDATE files SET mtime_ns = ? WHERE path = ?', (mtime_ns, path))
+            return True
+        return False
+
+    def store(self, path, signature, records, state):
+        path = os.path.abspath(path)
+        size, mtime_ns = signature
+        digest = file_digest(path)
+        rows = [(path, resource_type, json.dumps(key), json.dumps(entry[:3] + [
+                    entry[3].to_dict() if entry[3] is not None else None]))
+                for (resource_type, key), entry in state.index.items()]
+        with self.conn:
+            self.conn.execute('DELETE FROM entries WHERE path = ?', (path,))
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                              (path, size, mtime_ns, digest, records, time.time()))
+            self.conn.executemany('INSERT INTO entries VALUES (?, ?, ?, ?)', rows)
+
+    def load_state(self, paths):
+        """Merge the stored entries of the given files into one NetState."""
+        wanted = {os.path.abspath(path) for path in paths}
+        state = NetState()
+        for path, resource_type, key, entry in self.conn.execute(
+                'SELECT path, resource_type, key, state FROM entries ORDER BY rowid'):
+            if path not in wanted:
+                continue
+            created_at, deleted_at, data_at, data = json.loads(entry)
+            if data is not None:
+                data = RESOURCE_RECORDS[resource_type].from_dict(data)
+            state.merge_entry((resource_type, _key_from_json(key)), [
+                _at_from_json(created_at), _at_from_json(deleted_at), _at_from_json(data_at), data])
+        return self.apply_deletions(state)
+
+    def apply_deletions(self, state):
+        """Feed recorded successful deletions back into a NetState as delete events."""
+        for resource_type, key, updated_at in self.conn.execute(
+                "SELECT resource_type, key, updated_at FROM deletions WHERE status = 'deleted'"):
+            state_key = (resource_type, _key_from_json(key))
+            if state_key in state.index:
+                state.merge_entry(state_key, [None, (updated_at, DELETE_RANK), None, None])
+        return state
+
+    def file_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def record_deletion(self, resource_type, key, error=None):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO deletions VALUES (?, ?, ?, ?, ?)',
+                (resource_type, json.dumps(key), 'deleted' if error is None else 'failed',
+                 None if error is None else str(error), _utc_now()))
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+
+from extractors import RESOURCE_RECORDS, RESOURCE_TYPES, resource_key
+
+# Outcomes written before the journal is fsync'd; a crash loses at most
+# this many, and those resources are simply tried again on resume
+JOURNAL_SYNC_BATCH = 100
+# Seconds after which pending outcomes are fsync'd even if the batch is not full
+JOURNAL_SYNC_INTERVAL = 2.0
+
+
+def _key_text(resource_type, resource):
+    return json.dumps(resource_key(resource_type, resource))
+
+
+class DeletionJournal:
+    """
+    Append-only log of one deletion run, one JSON object per line.
+
+    start() writes a run header with the approved resource types and an
+    intent line, carrying the full record, for every resource of the run,
+    and fsyncs them before anything is deleted. record() appends the
+    outcome of each deletion; outcomes are fsync'd in batches. replay()
+    reads the last run back so an interrupted run can resume with only the
+    resources that are still pending or failed.
+    """
+
+    def __init__(self, path, sync_batch=JOURNAL_SYNC_BATCH, sync_interval=JOURNAL_SYNC_INTERVAL):
+        self.path = path
+        self.sync_batch = sync_batch
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.file = open(path, 'a+', encoding='utf-8')
+        # A crash can leave half a line; never append to it
+        self.file.seek(0, os.SEEK_END)
+        if self.file.tell():
+            self.file.seek(self.file.tell() - 1)
+            if self.file.read(1) != '\n':
+                self.file.write('\n')
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry) + '\n')
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def start(self, resources, approved):
+        with self.lock:
+            self._write({'op': 'run', 'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                         'approved': sorted(approved)})
+            for resource_type, found in resources.items():
+                for resource in found:
+                    self._write({'op': 'intent', 'type': resource_type,
+                                 'key': _key_text(resource_type, resource),
+                                 'resource': resource.to_dict()})
+            self._sync()
+
+    def resume(self):
+        with self.lock:
+            self._write({'op': 'resume', 'at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())})
+            self._sync()
+
+    def record(self, resource_type, resource, error=None):
+        with self.lock:
+            self._write({'op': 'done', 'type': resource_type,
+                         'key': _key_text(resource_type, resource),
+                         'error': None if error is None else str(error)})
+            self.unsynced += 1
+            if (self.unsynced >= self.sync_batch
+                    or time.monotonic() - self.synced_at >= self.sync_interval):
+                self._sync()
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.file.close()
+
+    def replay(self):
+        """
+        The last run in the journal: (resources still to delete, approved
+        types, number already deleted). Resources whose deletion failed or
+        has no recorded outcome are returned in the order they were planned.
+        """
+        with self.lock:
+            self.file.flush()
+        intents, deleted, approved = {}, set(), None
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The torn last line of an interrupted write
+                    continue
+                if entry['op'] == 'run':
+                    intents, deleted, approved = {}, set(), set(entry['approved'])
+                elif entry['op'] == 'intent':
+                    intents[(entry['type'], entry['key'])] = entry['resource']
+                elif entry['op'] == 'done' and entry['error'] is None:
+                    deleted.add((entry['type'], entry['key']))
+        if approved is None:
+            raise ValueError(f"No deletion run recorded in {self.path}")
+
+        resources = {resource_type: [] for resource_type in RESOURCE_TYPES}
+        for (resource_type, key), data in intents.items():
+            if (resource_type, key) not in deleted:
+                resources[resource_type].append(RESOURCE_RECORDS[resource_type].from_dict(data))
+        return resources, approved, len(deleted & intents.keys())
@@ -0,0 +1,168 @@
+import re
+
+from botocore.exceptions import ClientError
+
+from batching import chunks
+
+# DescribeInstances / DescribeVolumes accept up to 1000 IDs per request
+DESCRIBE_BATCH = 1000
+
+# State reported for IDs that EC2 no longer knows about at all
+MISSING = 'missing'
+
+_INSTANCE_ID = re.compile(r'i-[0-9a-f]+')
+_VOLUME_ID = re.compile(r'vol-[0-9a-f]+')
+
+
+def pages(method, **kwargs):
+    # Manual pagination so each page goes through the throttled client
+    while True:
+        page = method(**kwargs)
+        yield page
+        if not page.get('NextToken'):
+            return
+        kwargs['NextToken'] = page['NextToken']
+
+
+def _describe_states(describe, ids, id_pattern, not_found_codes):
+    """
+    Describe many IDs in as few calls as possible. A single unknown ID makes
+    EC2 reject the whole request, so the unknown IDs are read out of the
+    error message, recorded as missing and the rest is asked for again.
+    """
+    states = {}
+    for batch in chunks(sorted(set(ids)), DESCRIBE_BATCH):
+        batch = list(batch)
+        while batch:
+            try:
+                states.update(describe(batch))
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] not in not_found_codes:
+                    raise
+                gone = set(id_pattern.findall(e.response['Error'].get('Message', ''))) & set(batch)
+                if not gone:
+                    raise
+                for resource_id in gone:
+                    states[resource_id] = MISSING
+                batch = [resource_id for resource_id in batch if resource_id not in gone]
+    return states
+
+
+def describe_instances(ec2, instance_ids):
+    """DescribeInstances output per instance ID, or MISSING for IDs EC2 does not know."""
+    def describe(batch):
+        described = {}
+        for page in pages(ec2.describe_instances, InstanceIds=batch):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    described[instance['InstanceId']] = instance
+        # Instances that have aged out of the API are simply not returned
+        for instance_id in batch:
+            described.setdefault(instance_id, MISSING)
+        return described
+
+    return _describe_states(describe, instance_ids, _INSTANCE_ID,
+                            {'InvalidInstanceID.NotFound', 'InvalidInstanceID.Malformed'})
+
+
+def instance_states(ec2, instance_ids):
+    return {instance_id: MISSING if instance == MISSING else instance['State']['Name']
+            for instance_id, instance in describe_instances(ec2, instance_ids).items()}
+
+
+def volume_states(ec2, volume_ids):
+    def describe(batch):
+        states = {}
+        for page in pages(ec2.describe_volumes, VolumeIds=batch):
+            for volume in page['Volumes']:
+                states[volume['VolumeId']] = volume['State']
+        for volume_id in batch:
+            states.setdefault(volume_id, MISSING)
+        return states
+
+    return _describe_states(describe, volume_ids, _VOLUME_ID,
+                            {'InvalidVolume.NotFound', 'InvalidVolume.Malformed'})
+
+
+def bucket_names(s3):
+    names = set()
+    kwargs = {}
+    while True:
+        page = s3.list_buckets(**kwargs)
+        names.update(bucket['Name'] for bucket in page['Buckets'])
+        if not page.get('ContinuationToken'):
+            return names
+        kwargs['ContinuationToken'] = page['ContinuationToken']
+
+
+def _record_key(name, record_type):
+    # The API returns fully qualified, octal-escaped names (\052 for '*');
+    # CloudTrail has them as they were submitted
+    name = name.replace('\\052', '*').rstrip('.').lower()
+    return name, record_type
+
+
+def zone_record_keys(route53, zone_id):
+    keys = set()
+    kwargs = {'HostedZoneId': zone_id}
+    while True:
+        page = route53.list_resource_record_sets(**kwargs)
+        keys.update(_record_key(rr_set['Name'], rr_set['Type'])
+                    for rr_set in page['ResourceRecordSets'])
+        if not page.get('IsTruncated'):
+            return keys
+        kwargs['StartRecordName'] = page['NextRecordName']
+        kwargs['StartRecordType'] = page['NextRecordType']
+        if page.get('NextRecordIdentifier'):
+            kwargs['StartRecordIdentifier'] = page['NextRecordIdentifier']
+
+
+def prune_missing(resources, ec2, s3, route53, listed_buckets=None):
+    """
+    Drop resources that no longer exist, checking each service in bulk:
+    instances and volumes 1000 IDs per describe call, one ListBuckets and
+    one ListResourceRecordSets pass per hosted zone. Types without a bulk
+    check are passed through unchanged. ListBuckets covers the whole
+    account, so callers checking several regions pass its bucket names in
+    `listed_buckets` instead of listing them again.
+
+    Returns the pruned resources and the number of resources dropped.
+    """
+    pruned = dict(resources)
+
+    instances = resources['EC2.Instances.Created']
+    if instances:
+        states = instance_states(ec2, [i.instance_id for i in instances])
+        pruned['EC2.Instances.Created'] = [
+            i for i in instances
+            if states.get(i.instance_id) not in ('terminated', 'shutting-down', MISSING)]
+
+    volumes = resources['EC2.Volumes.Created']
+    if volumes:
+        states = volume_states(ec2, [v.volume_id for v in volumes])
+        pruned['EC2.Volumes.Created'] = [
+            v for v in volumes
+            if states.get(v.volume_id) not in ('deleting', 'deleted', MISSING)]
+
+    buckets = resources['S3.Buckets.Created']
+    if buckets:
+        existing = bucket_names(s3) if listed_buckets is None else listed_buckets
+        pruned['S3.Buckets.Created'] = [b for b in buckets if b.bucket_name in existing]
+
+    records = resources['Route53']
+    if records:
+        existing = {}
+        for zone_id in {r.hosted_zone_id for r in records}:
+            try:
+                existing[zone_id] = zone_record_keys(route53, zone_id)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'NoSuchHostedZone':
+                    raise
+                existing[zone_id] = set()
+        pruned['Route53'] = [
+            r for r in records
+            if _record_key(r.name, r.type) in existing[r.hosted_zone_id]]
+
+    dropped = sum(len(resources[t]) - len(pruned[t]) for t in resources)
+    return pruned, dropped
@@ -0,0 +1,128 @@
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from clients import GLOBAL_REGION
+from engine import DEFAULT_LIMIT, GLOBAL_SERVICES, SERVICE_LIMITS
+from extractors import DELETE, EXTRACTORS
+from metrics import METRICS
+
+# LookupEvents returns at most 50 events per page
+LOOKUP_PAGE_SIZE = 50
+# Default length of the time slices fetched in parallel
+LOOKUP_SLICE = timedelta(hours=6)
+# Events can show up in LookupEvents this long after they happened, so
+# slices ending later than this ago are fetched again instead of cached
+LOOKUP_SETTLE = timedelta(minutes=30)
+
+
+def event_names(include_deletes=False):
+    """(event source, event name) pairs worth looking up; create-type only unless asked."""
+    return sorted(event for event, (_, action, _) in EXTRACTORS.items()
+                  if include_deletes or action != DELETE)
+
+
+def _event_time(at):
+    return at.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def time_slices(start, end, length=LOOKUP_SLICE):
+    # Aligned to multiples of length, so runs over overlapping windows
+    # share cached slices
+    step = int(length.total_seconds())
+    first = int(start.timestamp()) // step * step
+    return [(datetime.fromtimestamp(at, timezone.utc),
+             datetime.fromtimestamp(at + step, timezone.utc))
+            for at in range(first, int(end.timestamp()), step)]
+
+
+class LookupCache:
+    """Gzipped CloudTrailEvent payloads of settled slices, one file per slice and event name."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, scope, event_name, window):
+        start, end = window
+        return os.path.join(self.directory, f"{scope}_{event_name}_{start:%Y%m%dT%H%MZ}_"
+                                            f"{int((end - start).total_seconds())}.jsonl.gz")
+
+    def get(self, scope, event_name, window):
+        try:
+            with gzip.open(self._path(scope, event_name, window), 'rt', encoding='utf-8') as f:
+                return [line.rstrip('\n') for line in f]
+        except FileNotFoundError:
+            return None
+
+    def put(self, scope, event_name, window, events):
+        path = self._path(scope, event_name, window)
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            for event in events:
+                f.write(event + '\n')
+        os.replace(path + '.tmp', path)
+
+
+def _fetch(cloudtrail, event_name, window):
+    events = []
+    kwargs = {'LookupAttributes': [{'AttributeKey': 'EventName', 'AttributeValue': event_name}],
+              'StartTime': window[0], 'EndTime': window[1], 'MaxResults': LOOKUP_PAGE_SIZE}
+    while True:
+        page = cloudtrail.lookup_events(**kwargs)
+        events.extend(event['CloudTrailEvent'] for event in page.get('Events', []))
+        if not page.get('NextToken'):
+            return events
+        kwargs['NextToken'] = page['NextToken']
+
+
+def lookup_records(clients, regions, start, end, accounts=(None,), cache=None,
+                   include_deletes=False, slice_length=LOOKUP_SLICE, now=None):
+    """
+    Yield CloudTrail records between start and end straight from the
+    LookupEvents API, decoded like records read from trail files.
+
+    LookupEvents filters on one event name per call, so the window is cut
+    into slices and every (account, region, event name, slice) is fetched
+    as its own paginated request chain. They run concurrently; the
+    cloudtrail rate limit (2 requests/sec per account and region) is kept
+    by the throttled clients. Global service events are only looked up in
+    us-east-1, where CloudTrail records them. Slices that have settled are
+    cached and not fetched again.
+    """
+    now = now or datetime.now(timezone.utc)
+    slices = time_slices(start, end, slice_length)
+    units = []
+    for account in accounts:
+        for source, name in event_names(include_deletes):
+            # Global events are looked up even if us-east-1 is not in regions
+            event_regions = ([GLOBAL_REGION] if source.split('.')[0] in GLOBAL_SERVICES
+                             else regions)
+            units.extend((account, region, name, window)
+                         for region in event_regions for window in slices)
+
+    def fetch(unit):
+        account, region, name, window = unit
+        scope = f"{clients.profiles.get(account) or 'default'}_{account or ''}_{region}"
+        settled = window[1] <= now - LOOKUP_SETTLE
+        if cache is not None and settled:
+            events = cache.get(scope, name, window)
+            if events is not None:
+                METRICS.count('lookup_slices_cached')
+                return events
+        events = _fetch(clients.client('cloudtrail', region, account), name, window)
+        METRICS.count('lookup_slices_fetched')
+        if cache is not None and settled:
+            cache.put(scope, name, window, events)
+        return events
+
+    first, last = _event_time(start), _event_time(end)
+    workers = len(regions) * len(accounts) * SERVICE_LIMITS.get('cloudtrail', DEFAULT_LIMIT)[2]
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='lookup') as executor:
+        for events in executor.map(fetch, units):
+            for event in events:
+                record = json.loads(event)
+                # Whole slices are fetched and cached; trim to the window
+                if first <= record.get('eventTime', '') < last:
+                    yield record
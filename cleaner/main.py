@@ -1,219 +1,517 @@
+import argparse
+import cProfile
 import json
-import boto3
-from botocore.exceptions import ClientError
-
-def get_resources_to_delete(file_path):
-    with open(file_path) as f:
-        data = json.load(f)
-    
-    resources = {
-        'Route53': [],
-        'EC2.Volumes.Attached': [],
-        'EC2.Volumes.Created': [],
-        'IAM.InstanceProfile': [],
-        'IAM.Role': [],
-        'S3.Buckets.Created': [],
-        'EC2.PlacementGroup': [],
-        'EC2.Instances.Created': [],
-        'LOGS.LogStream': []
-    }
-
-    for record in data['Records']:
-        # Handle Route53 record creations
-        if record['eventSource'] == 'route53.amazonaws.com' and \
-           record['eventName'] == 'ChangeResourceRecordSets' and \
-           'requestParameters' in record and \
-           record['requestParameters'] is not None and \
-           'changeBatch' in record['requestParameters'] and \
-           'changes' in record['requestParameters']['changeBatch']:
-            changes = record['requestParameters']['changeBatch']['changes']
-            for change in changes:
-                if change['action'] == 'CREATE':
-                    rr_set = change['resourceRecordSet']
-                    resources['Route53'].append({
-                        'HostedZoneId': record['requestParameters']['hostedZoneId'],
-                        'Name': rr_set['name'],
-                        'Type': rr_set['type'],
-                        'TTL': rr_set.get('tTL', 300),
-                        'Values': [rr['value'] for rr in rr_set['resourceRecords']]
-                    })
-        
-        # Handle EC2 volume attachments
-        elif record['eventSource'] == 'ec2.amazonaws.com' and \
-             record['eventName'] == 'AttachVolume' and \
-             'requestParameters' in record and \
-             record['requestParameters'] is not None:
-            resources['EC2.Volumes.Attached'].append({
-                'VolumeId': record['requestParameters']['volumeId'],
-                'InstanceId': record['requestParameters']['instanceId'],
-                'Device': record['requestParameters']['device']
-            })
-
-       # Handle EC2 Volume Creation
-        elif record['eventSource'] == 'ec2.amazonaws.com' and \
-             record['eventName'] == 'CreateVolume' and \
-             'responseElements' in record and \
-             record['responseElements'] is not None:
-            resources['EC2.Volumes.Created'].append({
-                'VolumeId': record['responseElements']['volumeId'],
-                'Name': next((item['value'] for item in record['responseElements']['tagSet']['items'] 
-                            if item['key'] == 'Name'), 'Unnamed Volume')
-            })
-        # Handle Bucket Creation
-        elif record['eventSource'] == 's3.amazonaws.com' and \
-             record['eventName'] == 'CreateBucket' and \
-             'requestParameters' in record and \
-             record['requestParameters'] is not None:
-            resources['S3.Buckets.Created'].append({
-                'BucketName': record['requestParameters']['bucketName']
-            })
-        # Handle Placement Group Creation
-        elif record['eventSource'] == 'ec2.amazonaws.com' and \
-             record['eventName'] == 'CreatePlacementGroup' and \
-             'responseElements' in record and \
-             record['responseElements'] is not None:
-            resources['EC2.PlacementGroup'].append({
-                'PlacementGroupName': record['responseElements']['placementGroup']['groupArn']
-            })
-
-        # handle Instance Profile Creation
-        elif record['eventSource'] == 'iam.amazonaws.com' and \
-             record['eventName'] == 'CreateInstanceProfile' and \
-             'responseElements' in record and \
-             record['responseElements'] is not None:
-            resources['IAM.InstanceProfile'].append({
-                'InstanceProfileName': record['responseElements']['instanceProfile']['arn']
-            })
-
-        # handle Role Creation
-        elif record['eventSource'] == 'iam.amazonaws.com' and \
-             record['eventName'] == 'CreateRole' and \
-             'responseElements' in record and \
-             record['responseElements'] is not None:
-            resources['IAM.Role'].append({
-                'RoleName': record['responseElements']['role']['arn']
-            })
-
-        # Handle Run Instance
-        elif record['eventSource'] == 'ec2.amazonaws.com' and \
-             record['eventName'] == 'RunInstances' and \
-             'responseElements' in record and \
-             record['responseElements'] is not None:
-            resources['EC2.Instances.Created'].append({
-                'InstanceId': record['responseElements']['instancesSet']['items'][0]['instanceId'],
-                'Name': next((item['value'] for item in record['responseElements']['instancesSet']['items'][0]['tagSet']['items'] 
-                            if item['key'] == 'Name'), 'Unnamed Instance')
-            })
-
-        # Handle Log Stream Creation
-        elif record['eventSource'] == 'logs.amazonaws.com' and \
-             record['eventName'] == 'CreateLogStream' and \
-             'responseElements' in record and \
-             record['responseElements'] is not None:
-            resources['LOGS.LogStream'].append({
-                'LogStreamName': record['responseElements']['logStream']['logStreamName']
-            })
+import os
+import queue
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from botocore.exceptions import BotoCoreError, ClientError
+from batching import (EC2_TERMINATE_BATCH, chunks, delete_route53_records,
+                      route53_batches, terminate_instances)
+from clients import ClientPool
+from dag import Node, ServicePools, run_graph
+from discovery import discover_resources, enabled_regions, parse_tag_filters
+from drain import drain_bucket
+from engine import delete_one, throttle_summary
+from extractors import (RESOURCE_NAMES, RESOURCE_TYPES, NetState, by_location,
+                        merge_locations, resource_key)
+from filters import RecordFilter, parse_time
+from index import ParseIndex
+from journal import DeletionJournal
+from liveness import bucket_names, prune_missing
+from lookup import LookupCache, lookup_records
+from metrics import METRICS
+from trail import iter_records, iter_trail_files
+
+def _parse_files(paths, filters=()):
+    # Runs in a worker process: index each file of a batch with the extractors.
+    # With filters, only matching records are applied; kept is None for files
+    # ruled out without decoding them
+    record_filter = RecordFilter(filters) if filters else None
+    parsed = []
+    for path in paths:
+        state = NetState()
+        records = kept = 0
+        if record_filter is not None and record_filter.skip_file(path):
+            kept = None
+        else:
+            for record in iter_records(path):
+                records += 1
+                if record_filter is None or record_filter(record):
+                    state.apply(record)
+                    kept += 1
+        parsed.append((path, state, records, kept))
+    return parsed
+
+def _shard_files(files, workers):
+    # Pack files into batches of roughly equal size, several per worker so a
+    # slow batch does not leave the other cores idle at the end of the run
+    sizes = [(path, os.path.getsize(path)) for path in files]
+    target = max(1, sum(size for _, size in sizes) // (workers * 4))
+    batches, batch, batch_size = [], [], 0
+    for path, size in sizes:
+        batch.append(path)
+        batch_size += size
+        if batch_size >= target:
+            batches.append(batch)
+            batch, batch_size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _parse_all(files, workers, filters=()):
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() yields in submission order, so resources come out in the
+            # same order a single-process run would produce
+            for parsed in executor.map(partial(_parse_files, filters=tuple(filters)),
+                                       _shard_files(files, workers)):
+                yield from parsed
+    else:
+        yield from _parse_files(files, filters)
+
+def get_resources_to_delete(file_path, workers=1, index=None, filters=()):
+    # file_path may be a single file, a directory of CloudTrail logs, a glob
+    # or a list of any of those; records are streamed one at a time. Create,
+    # modify and delete events are reconciled per resource, so only what
+    # still exists at the end of the trail is returned, once.
+    # With a ParseIndex only new or changed files are parsed. filters are
+    # RecordFilter expressions; records they reject are never extracted.
+    # The index holds unfiltered results, so a filtered run parses every
+    # file and only uses the index for recorded deletions.
+    start = time.perf_counter()
+    with METRICS.phase('parse'):
+        files = list(iter_trail_files(file_path))
+        if index is None or filters:
+            stale = files
+        else:
+            stale = [path for path in files if not index.is_current(path)]
+            signatures = {path: index.file_signature(path) for path in stale}
+
+        state = NetState()
+        records = kept = skipped = 0
+        for path, file_state, file_records, file_kept in _parse_all(stale, workers, filters):
+            METRICS.count_extractors(file_state.matched)
+            if index is None or filters:
+                state.merge(file_state)
+            else:
+                index.store(path, signatures[path], file_records, file_state)
+            records += file_records
+            if file_kept is None:
+                skipped += 1
+            else:
+                kept += file_kept
+        if index is not None:
+            if filters:
+                index.apply_deletions(state)
+            else:
+                state = index.load_state(files)
+        resources = state.resources()
+    parsed = len(stale) - skipped
+
+    METRICS.count('files_parsed', parsed)
+    METRICS.count('files_from_index', len(files) - len(stale))
+    METRICS.count('records_scanned', records)
+    METRICS.count('resources_found', sum(len(v) for v in resources.values()))
+    if filters:
+        METRICS.count('files_skipped_by_filter', skipped)
+        METRICS.count('records_filtered_out', records - kept)
 
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    reused = f" ({len(files) - len(stale)} unchanged files from index)" if index is not None else ""
+    print(f"Parsed {parsed} files{reused}, {records} records in {elapsed:.2f}s "
+          f"({parsed / elapsed:.1f} files/sec, {records / elapsed:.0f} records/sec)")
+    if filters:
+        print(f"Filter kept {kept} of {records} records; {skipped} files skipped without decoding")
     return resources
 
-def delete_resources(resources):
-    # Initialize clients
-    route53 = boto3.client('route53')
-    ec2 = boto3.client('ec2')
-    iam = boto3.client('iam')
-    s3 = boto3.client('s3')
+def lookup_resources_to_delete(clients, since, until=None, regions=None, accounts=(None,),
+                               cache_dir=None, include_deletes=False, slice_hours=None, filters=()):
+    # Pull events from the LookupEvents API instead of exported trail files;
+    # records go through the same filters and extractors
+    start = time.perf_counter()
+    until = until or datetime.now(timezone.utc)
+    record_filter = RecordFilter(filters) if filters else None
+    with METRICS.phase('parse'):
+        if not regions:
+            regions = enabled_regions(clients.client('ec2', account=accounts[0]))
+        kwargs = {'slice_length': timedelta(hours=slice_hours)} if slice_hours else {}
+        state = NetState()
+        records = kept = 0
+        for record in lookup_records(clients, regions, since, until, accounts,
+                                     LookupCache(cache_dir) if cache_dir else None,
+                                     include_deletes, **kwargs):
+            records += 1
+            if record_filter is None or record_filter(record):
+                state.apply(record)
+                kept += 1
+        METRICS.count_extractors(state.matched)
+        resources = state.resources()
+
+    METRICS.count('records_scanned', records)
+    METRICS.count('resources_found', sum(len(v) for v in resources.values()))
+    if filters:
+        METRICS.count('records_filtered_out', records - kept)
+    print(f"Looked up {records} events in {len(regions)} regions in "
+          f"{time.perf_counter() - start:.2f}s ({METRICS.counters['lookup_slices_cached']} "
+          f"slices from cache, {METRICS.counters['lookup_slices_fetched']} fetched)")
+    return resources
+
+def discover_from_tags(clients, tag_expressions, regions=None, accounts=(None,)):
+    # Ask the Resource Groups Tagging API instead of reading trails; without
+    # regions, every region enabled for the first account is searched
+    start = time.perf_counter()
+    with METRICS.phase('discover'):
+        if not regions:
+            regions = enabled_regions(clients.client('ec2', account=accounts[0]))
+        resources = discover_resources(clients, regions, parse_tag_filters(tag_expressions),
+                                       accounts)
+    found = sum(len(v) for v in resources.values())
+    METRICS.count('resources_found', found)
+    print(f"Discovered {found} tagged resources in {len(regions)} regions "
+          f"and {len(accounts)} accounts in {time.perf_counter() - start:.2f}s")
+    return resources
+
+route53_name = RESOURCE_NAMES['Route53']
+
+def _confirm(title, lines, prompt):
+    print(f"\n{title} to delete:")
+    for line in lines:
+        print(f" - {line}")
+    with METRICS.phase('confirm'):
+        return input(f"\nDelete these {prompt}? (y/n): ").lower() == 'y'
+
+def _iam_pages(method, key, **kwargs):
+    # IAM paginates with Marker/IsTruncated rather than NextToken
+    while True:
+        page = method(**kwargs)
+        yield from page[key]
+        if not page.get('IsTruncated'):
+            return
+        kwargs['Marker'] = page['Marker']
+
+def _delete_instance_profile(iam, profile):
+    # A profile cannot be deleted while it still has a role in it
+    try:
+        details = iam.get_instance_profile(InstanceProfileName=profile.instance_profile_name)
+        for role in details['InstanceProfile']['Roles']:
+            iam.remove_role_from_instance_profile(
+                InstanceProfileName=profile.instance_profile_name, RoleName=role['RoleName'])
+        iam.delete_instance_profile(InstanceProfileName=profile.instance_profile_name)
+        return [(profile.arn, None)]
+    except (ClientError, BotoCoreError) as e:
+        return [(profile.arn, e)]
+
+def _delete_role(iam, role):
+    # delete_role fails with DeleteConflict until the role is out of every
+    # instance profile and has no inline or attached policies
+    name = role.role_name
+    try:
+        for profile in _iam_pages(iam.list_instance_profiles_for_role, 'InstanceProfiles', RoleName=name):
+            iam.remove_role_from_instance_profile(
+                InstanceProfileName=profile['InstanceProfileName'], RoleName=name)
+        for policy_name in _iam_pages(iam.list_role_policies, 'PolicyNames', RoleName=name):
+            iam.delete_role_policy(RoleName=name, PolicyName=policy_name)
+        for policy in _iam_pages(iam.list_attached_role_policies, 'AttachedPolicies', RoleName=name):
+            iam.detach_role_policy(RoleName=name, PolicyArn=policy['PolicyArn'])
+        iam.delete_role(RoleName=name)
+        return [(role.arn, None)]
+    except (ClientError, BotoCoreError) as e:
+        return [(role.arn, e)]
+
+def _delete_bucket(s3, bucket):
+    # delete_bucket fails with BucketNotEmpty until every object version
+    # and delete marker is gone
+    name = bucket.bucket_name
+    try:
+        stats = drain_bucket(s3, name, progress=lambda stats: print(f"Emptying {name}: {stats}"))
+        if stats.errors:
+            error = stats.errors[0]
+            return [(name, RuntimeError(f"{len(stats.errors)} objects could not be deleted, "
+                                        f"first {error['Key']}: {error.get('Message')}"))]
+        METRICS.count('s3_objects_deleted', stats.objects)
+        METRICS.count('s3_bytes_freed', stats.bytes)
+        if stats.objects:
+            print(f"Emptied {name}: {stats}")
+        s3.delete_bucket(Bucket=name)
+        return [(name, None)]
+    except (ClientError, BotoCoreError) as e:
+        return [(name, e)]
+
+def prune_resources(resources, clients):
+    # Check every account and region against its own endpoints, in parallel
+    locations = by_location(resources)
+    # ListBuckets is account-wide: list once per account, from any of its
+    # regions, and share the names across that account's regions
+    bucket_regions = {}
+    for (account, region), located in locations.items():
+        if located['S3.Buckets.Created']:
+            bucket_regions.setdefault(account, region)
+
+    def list_buckets(account):
+        return bucket_names(clients.client('s3', bucket_regions[account], account))
+
+    def prune(location):
+        location_clients = clients.for_location(*location)
+        return prune_missing(locations[location], location_clients['ec2'],
+                             location_clients['s3'], location_clients['route53'],
+                             buckets.get(location[0]))
+
+    with METRICS.phase('precheck'), ThreadPoolExecutor(max_workers=max(1, len(locations)),
+                                                       thread_name_prefix='precheck') as executor:
+        buckets = dict(zip(bucket_regions, executor.map(list_buckets, bucket_regions)))
+        results = dict(zip(locations, executor.map(prune, locations)))
+    METRICS.count('resources_already_gone', sum(dropped for _, dropped in results.values()))
+    return (merge_locations({location: pruned for location, (pruned, _) in results.items()}),
+            sum(dropped for _, dropped in results.values()))
+
+def _route53_line(r):
+    target = f"alias to {r.alias_target[1]}" if r.alias_target else ', '.join(r.values)
+    return f"{r.name} ({r.type}): {target}"
+
+# What is deleted, in the order it is confirmed: type -> (title, line, prompt)
+DELETION_PROMPTS = {
+    'Route53': ("Route53 Records", _route53_line, "Route53 records"),
+    'EC2.Instances.Created': ("EC2 Instances",
+                              lambda i: f"Instance {i.name} ({i.instance_id})", "EC2 instances"),
+    'EC2.Volumes.Created': ("EC2 Volumes", lambda v: f"Volume {v.name} ({v.volume_id})", "EC2 volumes"),
+    'Lambda.Function': ("Lambda Functions", lambda f: f"Function {f.function_name}", "Lambda functions"),
+    'EC2.NetworkInterface': ("EC2 Network Interfaces",
+                             lambda e: f"Network Interface {e.network_interface_id}",
+                             "EC2 network interfaces"),
+    'EC2.SecurityGroup': ("EC2 Security Groups",
+                          lambda g: f"Security Group {g.group_name} ({g.group_id})",
+                          "EC2 security groups"),
+    'EC2.PlacementGroup': ("EC2 Placement Groups",
+                           lambda g: f"Placement Group {g.placement_group_name}", "EC2 placement groups"),
+    'LOGS.LogGroup': ("CloudWatch Log Groups", lambda g: f"Log Group {g.log_group_name}",
+                      "CloudWatch log groups"),
+    'IAM.InstanceProfile': ("IAM Instance Profiles", lambda p: f"Instance Profile {p.arn}",
+                            "IAM instance profiles"),
+    'IAM.Role': ("IAM Roles", lambda r: f"Role {r.arn}", "IAM roles"),
+    'S3.Buckets.Created': ("S3 Buckets", lambda b: f"Bucket {b.bucket_name}", "S3 buckets"),
+}
+
+def _plan(resources, approved, clients):
+    # Deletion nodes for the approved types of one account and region
+    route53 = clients['route53']
+    ec2 = clients['ec2']
+    iam = clients['iam']
+    s3 = clients['s3']
+    logs = clients['logs']
+    lambda_client = clients['lambda']
+
+    nodes = []
+    terminating = {}
 
     # Delete Route53 records
-    if resources['Route53']:
-        print("\nRoute53 Records to delete:")
-        for record in resources['Route53']:
-            print(f" - {record['Name']} ({record['Type']}): {', '.join(record['Values'])}")
-        
-        if input("\nDelete these Route53 records? (y/n): ").lower() == 'y':
-            for record in resources['Route53']:
-                try:
-                    route53.change_resource_record_sets(
-                        HostedZoneId=record['HostedZoneId'],
-                        ChangeBatch={
-                            'Changes': [{
-                                'Action': 'DELETE',
-                                'ResourceRecordSet': {
-                                    'Name': record['Name'],
-                                    'Type': record['Type'],
-                                    'TTL': record['TTL'],
-                                    'ResourceRecords': [{'Value': v} for v in record['Values']]
-                                }
-                            }]
-                        }
-                    )
-                    print(f"Deleted {record['Name']}")
-                except ClientError as e:
-                    print(f"Error deleting {record['Name']}: {e}")
-
-    #Delete EC2 Instances
-    if resources['EC2.Instances.Created']:
-        print("\nEC2 Instances to delete:")
-        for instance in resources['EC2.Instances.Created']:
-            print(f" - Instance {instance['Name']} ({instance['InstanceId']})")
-        if input("\nDelete these EC2 instances? (y/n): ").lower() == 'y':
-            for instance in resources['EC2.Instances.Created']:
-                try:
-                    ec2.terminate_instances(InstanceIds=[instance['InstanceId']])
-                    print(f"Deleted {instance['InstanceId']}")
-                except ClientError as e:
-                    print(f"Error deleting {instance['InstanceId']}: {e}")
+    if 'Route53' in approved:
+        for zone_id, batch in route53_batches(resources['Route53']):
+            nodes.append(Node('route53', [route53_name(r) for r in batch], lambda batch=batch: [
+                (route53_name(record), error)
+                for record, error in delete_route53_records(route53, batch)]))
+
+    # Delete EC2 Instances
+    if 'EC2.Instances.Created' in approved:
+        terminating = {i.instance_id: i for i in resources['EC2.Instances.Created']}
+        for batch in chunks(resources['EC2.Instances.Created'], EC2_TERMINATE_BATCH):
+            nodes.append(Node('ec2', [i.instance_id for i in batch], lambda batch=batch: [
+                (instance.instance_id, error)
+                for instance, error in terminate_instances(ec2, batch)]))
+
+    def after_instances(instance_ids):
+        # Dependencies and bulk-polled readiness for instances being terminated
+        instance_ids = sorted(set(instance_ids) & terminating.keys())
+        return {
+            'deps': instance_ids,
+            'wait_for': [('instance', i, {'terminated'}) for i in instance_ids]
+        }
 
     # Delete EC2 Volumes
-    if resources['EC2.Volumes.Created']:
-        print("\nEC2 Volumes to delete:")
+    if 'EC2.Volumes.Created' in approved:
+        attached = {}
+        for attachment in resources['EC2.Volumes.Attached']:
+            attached.setdefault(attachment.volume_id, set()).add(attachment.instance_id)
         for vol in resources['EC2.Volumes.Created']:
-            print(f" - Volume {vol['Name']} ({vol['VolumeId']})")
-        if input("\nDelete these EC2 volumes? (y/n): ").lower() == 'y':
-            for vol in resources['EC2.Volumes.Created']:
-                try:
-                    ec2.delete_volume(VolumeId=vol['VolumeId'])
-                    print(f"Deleted {vol['VolumeId']}")
-                except ClientError as e:
-                    print(f"Error deleting {vol['VolumeId']}: {e}")
+            instance_ids = sorted(attached.get(vol.volume_id, set()) & terminating.keys())
+            # Once its instance is gone the volume detaches and becomes available
+            nodes.append(Node('ec2', [vol.volume_id],
+                              partial(delete_one, vol.volume_id, ec2.delete_volume,
+                                      VolumeId=vol.volume_id),
+                              deps=instance_ids,
+                              wait_for=[('volume', vol.volume_id, {'available'})] if instance_ids else []))
+
+    # Delete Lambda Functions
+    if 'Lambda.Function' in approved:
+        for function in resources['Lambda.Function']:
+            nodes.append(Node('lambda', [function.function_name],
+                              partial(delete_one, function.function_name,
+                                      lambda_client.delete_function,
+                                      FunctionName=function.function_name)))
+
+    # Delete EC2 Network Interfaces
+    if 'EC2.NetworkInterface' in approved:
+        for eni in resources['EC2.NetworkInterface']:
+            nodes.append(Node('ec2', [eni.network_interface_id],
+                              partial(delete_one, eni.network_interface_id,
+                                      ec2.delete_network_interface,
+                                      NetworkInterfaceId=eni.network_interface_id)))
+
+    # Delete EC2 Security Groups
+    if 'EC2.SecurityGroup' in approved:
+        for group in resources['EC2.SecurityGroup']:
+            users = [i for i, instance in terminating.items()
+                     if group.group_id in (instance.security_group_ids or ())]
+            nodes.append(Node('ec2', [group.group_id],
+                              partial(delete_one, group.group_id, ec2.delete_security_group,
+                                      GroupId=group.group_id),
+                              **after_instances(users)))
+
+    # Delete EC2 Placement Groups
+    if 'EC2.PlacementGroup' in approved:
+        for group in resources['EC2.PlacementGroup']:
+            members = [i for i, instance in terminating.items()
+                       if instance.placement_group_name == group.placement_group_name]
+            nodes.append(Node('ec2', [group.placement_group_name],
+                              partial(delete_one, group.placement_group_name,
+                                      ec2.delete_placement_group,
+                                      GroupName=group.placement_group_name),
+                              **after_instances(members)))
+
+    # Delete CloudWatch Log Groups
+    if 'LOGS.LogGroup' in approved:
+        for group in resources['LOGS.LogGroup']:
+            nodes.append(Node('logs', [group.log_group_name],
+                              partial(delete_one, group.log_group_name, logs.delete_log_group,
+                                      logGroupName=group.log_group_name)))
 
     # Delete IAM Instance Profiles
-    if resources['IAM.InstanceProfile']:
-        print("\nIAM Instance Profiles to delete:")
+    profile_arns = {}
+    if 'IAM.InstanceProfile' in approved:
         for profile in resources['IAM.InstanceProfile']:
-            print(f" - Instance Profile {profile['InstanceProfileName']}")
-        if input("\nDelete these IAM instance profiles? (y/n): ").lower() == 'y':
-            for profile in resources['IAM.InstanceProfile']:
-                try:
-                    iam.delete_instance_profile(arn=profile['InstanceProfileName'])
-                    print(f"Deleted {profile['InstanceProfileName']}")
-                except ClientError as e:
-                    print(f"Error deleting {profile['InstanceProfileName']}: {e}")
-    
-    # Delete IAM Roles
-    if resources['IAM.Role']:
-        print("\nIAM Roles to delete:")
+            profile_arns[profile.instance_profile_name] = profile.arn
+            nodes.append(Node('iam', [profile.arn], partial(_delete_instance_profile, iam, profile)))
+
+    # Delete IAM Roles, after the instance profiles they were added to
+    if 'IAM.Role' in approved:
         for role in resources['IAM.Role']:
-            print(f" - Role {role['RoleName']}")
-        if input("\nDelete these IAM roles? (y/n): ").lower() == 'y':
-            for role in resources['IAM.Role']:
-                try:
-                    iam.delete_role(arn=role['RoleName'])
-                    print(f"Deleted {role['RoleName']}")
-                except ClientError as e:
-                    print(f"Error deleting {role['RoleName']}: {e}")
-    
-    # Delete S3 Buckets
-    if resources['S3.Buckets.Created']:
-        print("\nS3 Buckets to delete:")
+            profiles = [profile_arns[link.instance_profile_name]
+                        for link in resources['IAM.InstanceProfile.Roles']
+                        if link.role_name == role.role_name
+                        and link.instance_profile_name in profile_arns]
+            nodes.append(Node('iam', [role.arn], partial(_delete_role, iam, role), deps=profiles))
+
+    # Empty and delete S3 Buckets
+    if 'S3.Buckets.Created' in approved:
         for bucket in resources['S3.Buckets.Created']:
-            print(f" - Bucket {bucket['BucketName']}")
-        if input("\nDelete these S3 buckets? (y/n): ").lower() == 'y':
-            for bucket in resources['S3.Buckets.Created']:
-                try:
-                    s3.delete_bucket(Bucket=bucket['BucketName'])
-                    print(f"Deleted {bucket['BucketName']}")
-                except ClientError as e:
-                    print(f"Error deleting {bucket['BucketName']}: {e}")
+            nodes.append(Node('s3', [bucket.bucket_name], partial(_delete_bucket, s3, bucket)))
+    return nodes
+
+def _location_labels(locations):
+    # Only spell out the parts that differ between the resources
+    accounts = len({account for account, _ in locations}) > 1
+    regions = len({region for _, region in locations}) > 1
+    return {(account, region): ' '.join(filter(None, (accounts and account, regions and region)))
+            for account, region in locations}
+
+def delete_resources(resources, clients=None, index=None, journal=None, approved=None):
+    # approved skips the prompts, for a run resumed from its journal
+    clients = clients or ClientPool()
+    locations = by_location(resources)
+    labels = _location_labels(locations)
+
+    def where(resource):
+        label = labels[(resource.account, resource.region)]
+        return f" [{label}]" if label else ""
+
+    # Ask about every resource type first, then run the approved deletions as
+    # one dependency graph per account and region, all of them in parallel:
+    # a node starts once the resources it depends on are gone, everything
+    # else runs in parallel across services
+    if approved is None:
+        approved = set()
+        for resource_type, (title, line, prompt) in DELETION_PROMPTS.items():
+            if resources[resource_type] and _confirm(
+                    title, [line(r) + where(r) for r in resources[resource_type]], prompt):
+                approved.add(resource_type)
+        if journal is not None:
+            # Declined types are left out; the rest only inform the plan
+            journal.start({resource_type: found for resource_type, found in resources.items()
+                           if resource_type in approved or resource_type not in DELETION_PROMPTS},
+                          approved)
+
+    # Map result names back to resources so outcomes can be recorded
+    planned = {((r.account, r.region), RESOURCE_NAMES[resource_type](r)): (resource_type, r)
+               for resource_type, found in resources.items() for r in found}
+
+    results = queue.Queue()
+    # Set on Ctrl-C: no further node is started anywhere
+    cancel = threading.Event()
+    # One concurrency cap per service across all locations
+    pools = ServicePools()
+
+    def run(location, located):
+        try:
+            location_clients = clients.for_location(*location)
+            nodes = _plan(located, approved, location_clients)
+            for name, error in run_graph(nodes, location_clients['ec2'], cancel=cancel,
+                                         pools=pools, location=location):
+                results.put((location, name, error))
+        finally:
+            results.put(None)
+
+    def report(location, name, error):
+        if (location, name) in planned:
+            resource_type, resource = planned[(location, name)]
+            METRICS.outcome(resource_type, error is None)
+            if journal is not None:
+                journal.record(resource_type, resource, error)
+            if index is not None:
+                index.record_deletion(resource_type, resource_key(resource_type, resource), error)
+        label = f" [{labels[location]}]" if labels[location] else ""
+        if error is None:
+            print(f"Deleted {name}{label}")
+        else:
+            print(f"Error deleting {name}{label}: {error}")
+
+    try:
+        with METRICS.phase('delete'), ThreadPoolExecutor(max_workers=max(1, len(locations)),
+                                                         thread_name_prefix='location') as executor:
+            futures = [executor.submit(run, location, located) for location, located in locations.items()]
+            running = len(futures)
+            try:
+                while running:
+                    result = results.get()
+                    if result is None:
+                        running -= 1
+                    else:
+                        report(*result)
+            except KeyboardInterrupt:
+                # Stop starting deletions, but record the outcome of every one
+                # already sent so a resume does not retry resources that are gone
+                print("Interrupted, waiting for deletions in flight to finish")
+                cancel.set()
+                running -= sum(future.cancel() for future in futures)
+                while running:
+                    result = results.get()
+                    if result is None:
+                        running -= 1
+                    else:
+                        report(*result)
+                raise
+            for future in futures:
+                future.result()
+    finally:
+        pools.shutdown()
+
+    for scope, stats in throttle_summary().items():
+        if stats['retries']:
+            print(f"{scope}: {stats['calls']} calls, {stats['retries']} retries, "
+                  f"{stats['throttles']} throttled, settled at {stats['rate']} req/s")
 
     # # Detach EC2 volumes
     # if resources['EC2.Volumes.Attached']:
@@ -236,18 +534,165 @@ def delete_resources(resources):
     #                     print(f"Error detaching {vol['VolumeId']}: {e}")
 
 
-if __name__ == '__main__':
-    #file_path = input("Enter path to AWS resources JSON file: ")
-    file_path = './aws-resources.json'
-    resources = get_resources_to_delete(file_path)
-    
-    if not any(resources.values()):
-        print("No deletable resources found in the file")
-        exit()
-
-    print(f"\nFound:  \n{len(resources['Route53'])} Route53 records \n{len(resources['EC2.Volumes.Attached'])} EC2 volumes Attached \n{len(resources['EC2.Volumes.Created'])} EC2 volumes Created \n{len(resources['IAM.InstanceProfile'])} IAM instance profiles \n{len(resources['IAM.Role'])} IAM roles \n{len(resources['S3.Buckets.Created'])} S3 buckets \n{len(resources['EC2.PlacementGroup'])} EC2 placement groups \n{len(resources['EC2.Instances.Created'])} EC2 instances")
+def _utc_time(value):
+    try:
+        return parse_time(value).replace(tzinfo=timezone.utc)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+# Allocation sites listed in the report with --tracemalloc
+TOP_ALLOCATIONS = 25
+
+def write_report(path, memory=False):
+    # Structured summary of the run, for tracking nightly sweeps over time
+    report = METRICS.report()
+    report['rate_limits'] = throttle_summary()
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        report['memory'] = {
+            'current_mb': round(current / (1024 * 1024), 1),
+            'peak_mb': round(peak / (1024 * 1024), 1),
+            'top': [{'where': str(stat.traceback), 'kb': round(stat.size / 1024, 1), 'blocks': stat.count}
+                    for stat in tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]],
+        }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+def run(args):
+    index = ParseIndex(args.index) if args.index else None
+    journal = DeletionJournal(args.journal) if args.journal else None
+    try:
+        _run(args, index, journal)
+    finally:
+        if journal is not None:
+            journal.close()
+        if index is not None:
+            index.close()
+
+def _run(args, index, journal):
+    profiles = dict(mapping.split('=', 1) for mapping in args.profile)
+    clients = ClientPool(profiles)
+    approved = None
+    if args.resume:
+        resources, approved, deleted = journal.replay()
+        METRICS.count('resumed_already_deleted', deleted)
+        print(f"Resuming from {args.journal}: {deleted} resources deleted earlier, "
+              f"{sum(len(resources[t]) for t in approved)} still to delete")
+        if not any(resources[resource_type] for resource_type in approved):
+            return
+    elif args.tag:
+        resources = discover_from_tags(clients, args.tag, args.regions, list(profiles) or [None])
+        if not any(resources.values()):
+            print("No resources with these tags found")
+            return
+    elif args.lookup_since:
+        resources = lookup_resources_to_delete(
+            clients, args.lookup_since, args.lookup_until, args.regions, list(profiles) or [None],
+            args.lookup_cache, args.lookup_deletes, args.lookup_slice, args.filter)
+        if not any(resources.values()):
+            print("No deletable resources found in the looked up events")
+            return
+    else:
+        resources = get_resources_to_delete(args.paths, args.workers or os.cpu_count(), index,
+                                            args.filter)
+
+        if not any(resources.values()):
+            print("No deletable resources found in the file")
+            return
+
+    if not args.no_precheck:
+        resources, dropped = prune_resources(resources, clients)
+        print(f"Skipping {dropped} resources that no longer exist")
+        if not any(resources.values()):
+            print("All resources in the file are already deleted")
+            return
+
+    if args.resume:
+        journal.resume()
+        delete_resources(resources, clients, index, journal, approved)
+        return
+
+    print("\nFound:  ")
+    for resource_type, label in RESOURCE_TYPES.items():
+        print(f"{len(resources[resource_type])} {label}")
     print(f"\nTotal resources to delete: {sum(len(v) for v in resources.values())}")
-    if input("Show resources to be deleted? (y/n): ").lower() == 'y':
-        delete_resources(resources)
+    with METRICS.phase('confirm'):
+        show = input("Show resources to be deleted? (y/n): ").lower() == 'y'
+    if show:
+        delete_resources(resources, clients, index, journal)
     else:
-        print("Aborted")
\ No newline at end of file
+        print("Aborted")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Delete AWS resources created in CloudTrail logs')
+    parser.add_argument('paths', nargs='*', default=['./aws-resources.json'],
+                        help='CloudTrail files (.json or .json.gz), directories or globs')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parse files in this many processes (0 = one per CPU)')
+    parser.add_argument('--no-precheck', action='store_true',
+                        help='Skip checking which resources still exist before listing them')
+    parser.add_argument('--index', metavar='PATH',
+                        help='SQLite index of parsed files; re-runs only parse new or changed files')
+    parser.add_argument('--profile', metavar='ACCOUNT=PROFILE', action='append', default=[],
+                        help='AWS profile to use for resources of this account (repeatable); '
+                             'other accounts use the default credentials')
+    parser.add_argument('--filter', metavar='EXPR', action='append', default=[],
+                        help='Only consider records matching all clauses, e.g. '
+                             '"arn=*/Combine-TS-WLDEVELOPER/* agent=*Terraform* since=2025-01-28"; '
+                             'fields: since, until, region, arn, agent, tag:KEY (repeatable)')
+    parser.add_argument('--tag', metavar='KEY[=VALUE,...]', action='append', default=[],
+                        help='Find resources by tag with the Resource Groups Tagging API '
+                             'instead of reading trail files (repeatable, all must match)')
+    parser.add_argument('--regions', type=lambda value: value.split(','),
+                        help='Comma-separated regions searched with --tag or --lookup-since '
+                             '(default: all enabled regions)')
+    parser.add_argument('--lookup-since', metavar='TIME', type=_utc_time,
+                        help='Fetch events since this date or UTC time with CloudTrail '
+                             'LookupEvents instead of reading trail files')
+    parser.add_argument('--lookup-until', metavar='TIME', type=_utc_time,
+                        help='End of the --lookup-since window (default: now)')
+    parser.add_argument('--lookup-slice', metavar='HOURS', type=float,
+                        help='Length of the time slices fetched in parallel (default: 6)')
+    parser.add_argument('--lookup-cache', metavar='DIR', default='.lookup-cache',
+                        help='Cache of fetched slices, reused by later runs (default: '
+                             '%(default)s; empty to disable)')
+    parser.add_argument('--lookup-deletes', action='store_true',
+                        help='Also fetch delete events, so resources deleted since are '
+                             'not listed without a precheck')
+    parser.add_argument('--journal', metavar='PATH', default='cleaner-journal.jsonl',
+                        help='Append-only log of planned and finished deletions (default: '
+                             '%(default)s; empty to disable)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the last run in the journal without prompting: only '
+                             'resources not yet deleted are tried again; trail files are not read')
+    parser.add_argument('--report', metavar='PATH',
+                        help='Write a JSON report of phase times, API latencies and outcomes')
+    parser.add_argument('--cprofile', metavar='PATH', help='Write cProfile stats of the run here')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='Trace allocations and add peak memory and top sites to the report')
+    args = parser.parse_args()
+    try:
+        RecordFilter(args.filter)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        parse_tag_filters(args.tag)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.resume and not (args.journal and os.path.exists(args.journal)):
+        parser.error(f"--resume needs an existing journal, {args.journal or 'none'} given")
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler:
+        profiler.enable()
+    try:
+        run(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        if args.report:
+            write_report(args.report, args.tracemalloc)
+
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+# Upper bounds (milliseconds) of the API latency histogram buckets
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = Counter()
+
+    def add(self, ms, error_code=None):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        if error_code:
+            self.errors[error_code] += 1
+
+    def to_dict(self):
+        calls = sum(self.counts)
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'calls': calls,
+            'mean_ms': round(self.total / calls, 2) if calls else 0,
+            'max_ms': round(self.max, 2),
+            'histogram': {label: count for label, count in zip(labels, self.counts) if count},
+            'errors': dict(self.errors),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe collector for one cleaner run: wall time per phase, counters,
+    API latency per (service, operation) and deletion outcomes per resource
+    type. report() returns all of it as one JSON-serialisable dict.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = Counter()
+        self.counters = Counter()
+        self.extractors = {}
+        self.api = {}
+        self.outcomes = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.phases[name] += elapsed
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def count_extractors(self, matched):
+        # matched: {(event source, event name): [records, resources]}
+        with self.lock:
+            for event, (records, resources) in matched.items():
+                entry = self.extractors.setdefault(event, [0, 0])
+                entry[0] += records
+                entry[1] += resources
+
+    def api_call(self, service, operation, ms, error_code=None):
+        with self.lock:
+            key = (service, operation)
+            if key not in self.api:
+                self.api[key] = LatencyHistogram()
+            self.api[key].add(ms, error_code)
+
+    def outcome(self, resource_type, ok):
+        with self.lock:
+            entry = self.outcomes.setdefault(resource_type, {'deleted': 0, 'failed': 0})
+            entry['deleted' if ok else 'failed'] += 1
+
+    def timed(self, service, operation, func):
+        """Wrap an API method so every attempt's latency and error code is recorded."""
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            error_code = None
+            try:
+                return func(*args, **kwargs)
+            except ClientError as e:
+                error_code = e.response['Error']['Code']
+                raise
+            except Exception as e:
+                error_code = type(e).__name__
+                raise
+            finally:
+                self.api_call(service, operation, (time.perf_counter() - start) * 1000, error_code)
+        return call
+
+    def report(self):
+        with self.lock:
+            return {
+                'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+                'wall_seconds': round(time.time() - self.started, 3),
+                'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                'counters': dict(self.counters),
+                'extractors': {f"{source} {name}": {'records': records, 'resources': resources}
+                               for (source, name), (records, resources) in
+                               sorted(self.extractors.items())},
+                'api': {f"{service}.{operation}": histogram.to_dict()
+                        for (service, operation), histogram in sorted(self.api.items())},
+                'outcomes': {name: dict(tally) for name, tally in self.outcomes.items()},
+            }
+
+
+METRICS = Metrics()
@@ -0,0 +1,128 @@
+import sys
+
+
+def _restore(cls, values):
+    return cls(**dict(zip(cls.FIELDS, values)))
+
+
+class Record:
+    """
+    Compact resource record: one __slots__ class per resource type instead
+    of a dict per resource.
+
+    Fields not given are None, so delete extractors only fill in the key.
+    Every record also carries the region and account of the CloudTrail
+    record it came from. Values of POOLED fields repeat across many
+    resources (regions, hosted zone IDs, log group names, ...) and are
+    interned, so every record shares one copy; this also holds for records
+    unpickled from parser worker processes.
+    """
+
+    __slots__ = ('region', 'account')
+    POOLED = ()
+    FIELDS = __slots__
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = cls.__slots__ + Record.__slots__
+        cls.POOLED = tuple(cls.POOLED) + Record.__slots__
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            value = fields.pop(name, None)
+            if value is not None and name in self.POOLED:
+                value = sys.intern(value)
+            setattr(self, name, value)
+        if fields:
+            raise TypeError(f"{type(self).__name__} has no field {', '.join(fields)}")
+
+    def astuple(self):
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    def to_dict(self):
+        return dict(zip(self.FIELDS, self.astuple()))
+
+    @classmethod
+    def from_dict(cls, data):
+        # JSON turns tuples into lists
+        return cls(**{name: tuple(value) if isinstance(value, list) else value
+                      for name, value in data.items()})
+
+    def __reduce__(self):
+        return _restore, (type(self), self.astuple())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.astuple() == other.astuple()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in self.to_dict().items())
+        return f"{type(self).__name__}({fields})"
+
+
+class Route53Record(Record):
+    # Alias records have no TTL or values; alias_target is their
+    # (hosted zone ID, DNS name, evaluate target health)
+    __slots__ = ('hosted_zone_id', 'name', 'type', 'ttl', 'values', 'alias_target')
+    POOLED = ('hosted_zone_id', 'type')
+
+
+class VolumeAttachment(Record):
+    __slots__ = ('volume_id', 'instance_id', 'device')
+    POOLED = ('device',)
+
+
+class Volume(Record):
+    __slots__ = ('volume_id', 'name')
+    POOLED = ('name',)
+
+
+class InstanceProfile(Record):
+    __slots__ = ('instance_profile_name', 'arn')
+
+
+class Role(Record):
+    __slots__ = ('role_name', 'arn')
+
+
+class InstanceProfileRole(Record):
+    __slots__ = ('instance_profile_name', 'role_name')
+    POOLED = ('instance_profile_name', 'role_name')
+
+
+class Bucket(Record):
+    __slots__ = ('bucket_name',)
+
+
+class PlacementGroup(Record):
+    __slots__ = ('placement_group_name', 'arn')
+
+
+class Instance(Record):
+    __slots__ = ('instance_id', 'name', 'placement_group_name', 'security_group_ids')
+    POOLED = ('name', 'placement_group_name')
+
+    def __init__(self, security_group_ids=None, **fields):
+        if security_group_ids is not None:
+            security_group_ids = tuple(sys.intern(group_id) for group_id in security_group_ids)
+        super().__init__(security_group_ids=security_group_ids, **fields)
+
+
+class LogStream(Record):
+    __slots__ = ('log_group_name', 'log_stream_name')
+    POOLED = ('log_group_name',)
+
+
+class LogGroup(Record):
+    __slots__ = ('log_group_name',)
+
+
+class SecurityGroup(Record):
+    __slots__ = ('group_id', 'group_name')
+
+
+class NetworkInterface(Record):
+    __slots__ = ('network_interface_id',)
+
+
+class LambdaFunction(Record):
+    __slots__ = ('function_name',)
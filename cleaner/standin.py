@@ -0,0 +1,202 @@
+import bisect
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+from engine import CLIENT_CONFIG
+
+
+class StandIn:
+    """
+    Local stand-in for the AWS APIs the cleaner calls, for benchmarks.
+
+    Real boto3 clients are used, so parameters are validated as usual, but
+    every call is answered from a before-call hook (the mechanism botocore's
+    Stubber uses) instead of going over the network. Each call sleeps for
+    `latency` seconds and is throttled with probability `throttle_rate`.
+    Terminated instances are remembered so readiness polling completes, and
+    every bucket starts out with `objects_per_bucket` object versions spread
+    over `prefixes` top-level prefixes. `tagged` is a list of (region, arn,
+    tags) served by the Resource Groups Tagging API, and `events` are
+    CloudTrail records served by LookupEvents in their awsRegion.
+    `bucket_names` are the buckets ListBuckets reports until they are
+    deleted.
+    """
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, seed=0, region='us-east-1',
+                 objects_per_bucket=0, prefixes=16, tagged=(), events=(), bucket_names=()):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.region = region
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.terminated = set()
+        self.objects_per_bucket = objects_per_bucket
+        self.prefixes = prefixes
+        self.buckets = {}
+        self.bucket_names = set(bucket_names)
+        self.objects_deleted = 0
+        self.bytes_deleted = 0
+        self.events = sorted(events, key=lambda event: event['eventTime'], reverse=True)
+        self.tagged = {}
+        for tagged_region, arn, tags in tagged:
+            self.tagged.setdefault(tagged_region, []).append((arn, tags))
+
+    def client(self, service, region=None, config=CLIENT_CONFIG):
+        client = boto3.client(service, region_name=region or self.region, config=config,
+                              aws_access_key_id='standin', aws_secret_access_key='standin')
+        client.meta.events.register('before-parameter-build.*.*', self._keep_params)
+        client.meta.events.register('before-call.*.*', self._respond)
+        return client
+
+    def _keep_params(self, params, context, **kwargs):
+        # before-call only sees the serialized request
+        context['standin_params'] = dict(params, StandInRegion=context['client_region'])
+
+    def _respond(self, model, context, **kwargs):
+        operation = model.name
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[operation] += 1
+            throttled = self.rng.random() < self.throttle_rate
+            if throttled:
+                self.throttled[operation] += 1
+        if throttled:
+            return AWSResponse(None, 400, {}, None), {
+                'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'},
+                'ResponseMetadata': {'HTTPStatusCode': 400}}
+        handler = getattr(self, f'_{operation}', None)
+        body = handler(context['standin_params']) if handler else {}
+        body['ResponseMetadata'] = {'HTTPStatusCode': 200}
+        return AWSResponse(None, 200, {}, None), body
+
+    def _TerminateInstances(self, params):
+        with self.lock:
+            self.terminated.update(params['InstanceIds'])
+        return {}
+
+    def _DescribeInstances(self, params):
+        return {'Reservations': [{'Instances': [
+            {'InstanceId': instance_id,
+             'State': {'Name': 'terminated' if instance_id in self.terminated else 'running'}}
+            for instance_id in params.get('InstanceIds', [])]}]}
+
+    def _DescribeVolumes(self, params):
+        return {'Volumes': [{'VolumeId': volume_id, 'State': 'available'}
+                            for volume_id in params.get('VolumeIds', [])]}
+
+    def _GetInstanceProfile(self, params):
+        return {'InstanceProfile': {'Roles': []}}
+
+    def _ListInstanceProfilesForRole(self, params):
+        return {'InstanceProfiles': [], 'IsTruncated': False}
+
+    def _ListRolePolicies(self, params):
+        return {'PolicyNames': [], 'IsTruncated': False}
+
+    def _ListAttachedRolePolicies(self, params):
+        return {'AttachedPolicies': [], 'IsTruncated': False}
+
+    def _bucket(self, name):
+        # (sorted keys, set of keys still present)
+        with self.lock:
+            if name not in self.buckets:
+                keys = sorted(f"{i % self.prefixes:02d}/object-{i:09d}"
+                              for i in range(self.objects_per_bucket))
+                self.buckets[name] = (keys, set(keys))
+            return self.buckets[name]
+
+    @staticmethod
+    def _size(key):
+        return 1024 * (int(key[-3:]) + 1)
+
+    def _ListObjectVersions(self, params):
+        keys, present = self._bucket(params['Bucket'])
+        prefix = params.get('Prefix', '')
+        delimiter = params.get('Delimiter')
+        limit = params.get('MaxKeys', 1000)
+        marker = params.get('KeyMarker')
+        position = bisect.bisect_right(keys, marker) if marker else bisect.bisect_left(keys, prefix)
+        versions, common, last = [], [], None
+        while position < len(keys) and keys[position].startswith(prefix):
+            if len(versions) + len(common) == limit:
+                return {'Versions': versions, 'CommonPrefixes': common,
+                        'IsTruncated': True, 'NextKeyMarker': last}
+            key = keys[position]
+            if delimiter and delimiter in key[len(prefix):]:
+                last = key[:key.index(delimiter, len(prefix)) + 1]
+                common.append({'Prefix': last})
+                position = bisect.bisect_right(keys, last + '\uffff')
+                continue
+            position += 1
+            if key in present:
+                versions.append({'Key': key, 'VersionId': 'v1', 'Size': self._size(key)})
+                last = key
+        return {'Versions': versions, 'CommonPrefixes': common, 'IsTruncated': False}
+
+    def _DeleteObjects(self, params):
+        _, present = self._bucket(params['Bucket'])
+        with self.lock:
+            for item in params['Delete']['Objects']:
+                if item['Key'] in present:
+                    present.discard(item['Key'])
+                    self.objects_deleted += 1
+                    self.bytes_deleted += self._size(item['Key'])
+        return {'Errors': []}
+
+    def _ListBuckets(self, params):
+        with self.lock:
+            return {'Buckets': [{'Name': name} for name in sorted(self.bucket_names)]}
+
+    def _DeleteBucket(self, params):
+        with self.lock:
+            self.bucket_names.discard(params['Bucket'])
+        return {}
+
+    def _ListResourceRecordSets(self, params):
+        return {'ResourceRecordSets': [], 'IsTruncated': False}
+
+    def _DescribeRegions(self, params):
+        return {'Regions': [{'RegionName': name} for name in sorted({self.region, *self.tagged})]}
+
+    def _GetResources(self, params):
+        wanted = params.get('ResourceTypeFilters')
+        found = []
+        for arn, tags in self.tagged.get(params['StandInRegion'], []):
+            service, resource = arn.split(':')[2], arn.split(':', 5)[5]
+            kind = f"{service}:{resource.split('/')[0].split(':')[0]}" if service != 's3' else 's3:bucket'
+            if wanted and kind not in wanted:
+                continue
+            if all(tag_filter['Key'] in tags and (not tag_filter.get('Values')
+                                                  or tags[tag_filter['Key']] in tag_filter['Values'])
+                   for tag_filter in params.get('TagFilters', [])):
+                found.append({'ResourceARN': arn,
+                              'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]})
+        start = int(params.get('PaginationToken') or 0)
+        end = start + params.get('ResourcesPerPage', 50)
+        return {'ResourceTagMappingList': found[start:end],
+                'PaginationToken': str(end) if end < len(found) else ''}
+
+    def _LookupEvents(self, params):
+        # Newest first, like CloudTrail
+        name = params['LookupAttributes'][0]['AttributeValue']
+        start = params['StartTime'].strftime('%Y-%m-%dT%H:%M:%SZ')
+        end = params['EndTime'].strftime('%Y-%m-%dT%H:%M:%SZ')
+        found = [event for event in self.events
+                 if event['awsRegion'] == params['StandInRegion'] and event['eventName'] == name
+                 and start <= event['eventTime'] < end]
+        offset = int(params.get('NextToken') or 0)
+        end = offset + params.get('MaxResults', 50)
+        page = {'Events': [{'EventId': event.get('eventID', ''), 'EventName': name,
+                            'CloudTrailEvent': json.dumps(event)} for event in found[offset:end]]}
+        if end < len(found):
+            page['NextToken'] = str(end)
+        return page
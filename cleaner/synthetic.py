@@ -0,0 +1,168 @@
+import gzip
+import json
+import os
+import random
+import re
+import zlib
+
+from engine import GLOBAL_SERVICES
+from extractors import DELETE, EXTRACTORS, RESOURCE_KEYS
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aws-resources.json')
+
+# Deletes are dated after every create of the fixture
+DELETE_EVENT_TIME = '2025-12-31T00:00:00Z'
+
+_AWS_ID = re.compile(r'(i|vol|sg|eni|pg)-[0-9a-f]{8,17}')
+
+# How to turn a created resource back into the request of its delete event
+_DELETE_EVENTS = {
+    'EC2.Volumes.Created': ('DeleteVolume', lambda r: {'volumeId': r.volume_id}),
+    'EC2.Instances.Created': ('TerminateInstances', lambda r: {
+        'instancesSet': {'items': [{'instanceId': r.instance_id}]}}),
+    'S3.Buckets.Created': ('DeleteBucket', lambda r: {'bucketName': r.bucket_name}),
+    'EC2.PlacementGroup': ('DeletePlacementGroup', lambda r: {'groupName': r.placement_group_name}),
+    'IAM.InstanceProfile': ('DeleteInstanceProfile', lambda r: {
+        'instanceProfileName': r.instance_profile_name}),
+    'IAM.Role': ('DeleteRole', lambda r: {'roleName': r.role_name}),
+    'IAM.InstanceProfile.Roles': ('RemoveRoleFromInstanceProfile', lambda r: {
+        'instanceProfileName': r.instance_profile_name, 'roleName': r.role_name}),
+    'EC2.Volumes.Attached': ('DetachVolume', lambda r: {
+        'volumeId': r.volume_id, 'instanceId': r.instance_id}),
+    'LOGS.LogStream': ('DeleteLogStream', lambda r: {
+        'logGroupName': r.log_group_name, 'logStreamName': r.log_stream_name}),
+}
+
+
+def _identities(resource_type, resource):
+    # The strings that make a resource unique; Route53 records keep their
+    # hosted zone so copies land in the same zones
+    if resource_type == 'Route53':
+        return [resource.name]
+    key = RESOURCE_KEYS[resource_type](resource)
+    return list(key) if isinstance(key, tuple) else [key]
+
+
+def _unique(value, copy):
+    # AWS style IDs stay hex of the same shape, names get a suffix
+    match = _AWS_ID.fullmatch(value)
+    if match:
+        return f"{match.group(1)}-{copy:08x}{zlib.crc32(value.encode()) & 0xfffffffff:09x}"
+    return f"{value}-{copy}"
+
+
+def _created(record):
+    resource_type, action, func = EXTRACTORS[(record['eventSource'], record['eventName'])]
+    found = func(record)
+    if action is not None:
+        found = [(action, resource) for resource in found]
+    return resource_type, [resource for found_action, resource in found if found_action != DELETE]
+
+
+class _Template:
+    def __init__(self, record):
+        self.text = json.dumps(record)
+        self.region = record.get('awsRegion')
+        # IAM and Route53 events are always logged in us-east-1
+        self.regional = record['eventSource'].split('.')[0] not in GLOBAL_SERVICES
+        self.resource_type, resources = _created(record)
+        self.identities = sorted({value for resource in resources
+                                  for value in _identities(self.resource_type, resource)},
+                                 key=len, reverse=True)
+
+    def render(self, copy, region=None):
+        text = self.text
+        for value in self.identities:
+            text = text.replace(value, _unique(value, copy))
+        if region and self.regional and region != self.region:
+            text = text.replace(f'"awsRegion": "{self.region}"', f'"awsRegion": "{region}"')
+        return text
+
+    def delete_events(self, text):
+        record = json.loads(text)
+        created = _created(record)[1]
+        if not created:
+            return []
+        if self.resource_type == 'Route53':
+            # The same change batch with DELETE instead of CREATE/UPSERT
+            for change in record['requestParameters']['changeBatch']['changes']:
+                change['action'] = 'DELETE'
+            return [json.dumps(dict(record, eventTime=DELETE_EVENT_TIME))]
+        if self.resource_type not in _DELETE_EVENTS:
+            return []
+        event_name, params = _DELETE_EVENTS[self.resource_type]
+        events = []
+        for resource in created:
+            event = dict(record, eventName=event_name, eventTime=DELETE_EVENT_TIME,
+                         requestParameters=params(resource), responseElements=None)
+            events.append(json.dumps(event))
+        return events
+
+
+def load_templates(path=FIXTURE):
+    with open(path) as f:
+        records = json.load(f)['Records']
+    matching, noise = [], []
+    for record in records:
+        if (record.get('eventSource'), record.get('eventName')) in EXTRACTORS:
+            matching.append(_Template(record))
+        else:
+            noise.append(json.dumps(record))
+    return matching, noise
+
+
+def generate_records(count, match_ratio=0.25, delete_ratio=0.0, seed=0, regions=None,
+                     templates=None):
+    """
+    Yield `count` CloudTrail records as JSON text, modelled on the fixture's
+    Terraform records.
+
+    Matching records replay the fixture's create events in order, one copy
+    of the stack after the other, with every resource identifier made unique
+    per copy so related events (volume, attachment, instance) still line up.
+    match_ratio is the share of records the extractors pick up; the rest are
+    the fixture's other events. delete_ratio is the share of created
+    resources that are deleted again later in the trail. With several
+    regions, successive copies of the stack go to successive regions.
+    """
+    matching, noise = templates or load_templates()
+    rng = random.Random(seed)
+    emitted = 0
+    position = 0
+    pending = []
+    while emitted < count:
+        if pending:
+            yield pending.pop()
+        elif rng.random() < match_ratio:
+            template = matching[position % len(matching)]
+            copy = position // len(matching)
+            text = template.render(copy, regions[copy % len(regions)] if regions else None)
+            position += 1
+            if delete_ratio and rng.random() < delete_ratio:
+                pending = template.delete_events(text)
+            yield text
+        else:
+            yield noise[rng.randrange(len(noise))]
+        emitted += 1
+
+
+def write_trail_files(directory, count, records_per_file=10000, compress=True, **mix):
+    """Write generated records as CloudTrail log files; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    opener, suffix = (gzip.open, '.json.gz') if compress else (open, '.json')
+    paths = []
+    records = generate_records(count, **mix)
+    remaining = count
+    while remaining > 0:
+        path = os.path.join(directory, f'trail-{len(paths):06d}{suffix}')
+        batch = min(records_per_file, remaining)
+        with opener(path, 'wt', encoding='utf-8') as out:
+            out.write('{"Records":[')
+            for i in range(batch):
+                if i:
+                    out.write(',')
+                out.write(next(records))
+            out.write(']}')
+        paths.append(path)
+        remaining -= batch
+    return paths
@@ -0,0 +1,131 @@
+import glob
+import gzip
+import json
+import os
+
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_trail_files(paths):
+    """
+    Expand files, directories and glob patterns into CloudTrail log files.
+
+    Directories are walked recursively and only `.json` / `.json.gz` files
+    inside them are picked up; explicitly named files are always used.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+
+    for path in paths:
+        path = os.fspath(path)
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.json') or name.endswith('.json.gz'):
+                        yield os.path.join(root, name)
+        elif os.path.exists(path):
+            yield path
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"No CloudTrail files match {path}")
+            for match in matches:
+                if os.path.isdir(match):
+                    yield from iter_trail_files(match)
+                else:
+                    yield match
+
+
+def open_trail_file(path, binary=False):
+    # CloudTrail delivers .json.gz objects, but exports are often renamed,
+    # so sniff the gzip magic instead of trusting the extension
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if binary:
+        return gzip.open(path, 'rb') if magic == GZIP_MAGIC else open(path, 'rb')
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _skip_whitespace(buf, pos):
+    while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def iter_file_records(path, chunk_size=CHUNK_SIZE):
+    """
+    Yield the entries of a CloudTrail file's `Records` array one at a time.
+
+    The file is read in chunks and each record is decoded as soon as it is
+    complete, so memory is bounded by the chunk size plus the largest single
+    record rather than by the size of the file. A bare top-level JSON array
+    of records is accepted as well.
+    """
+    with open_trail_file(path) as f:
+        buf = ''
+        eof = False
+
+        def fill(size):
+            nonlocal buf, eof
+            data = f.read(size)
+            if data:
+                buf += data
+            else:
+                eof = True
+
+        # Find the opening bracket of the records array
+        while True:
+            start = _skip_whitespace(buf, 0)
+            if start < len(buf) and buf[start] == '[':
+                pos = start + 1
+                break
+            key = buf.find('"Records"')
+            if key != -1:
+                pos = buf.find('[', key)
+                if pos != -1:
+                    pos += 1
+                    break
+            if eof:
+                return
+            fill(chunk_size)
+
+        read_size = chunk_size
+        while True:
+            pos = _skip_whitespace(buf, pos)
+            if pos < len(buf) and buf[pos] == ',':
+                pos = _skip_whitespace(buf, pos + 1)
+            if pos < len(buf) and buf[pos] == ']':
+                return
+
+            try:
+                if pos >= len(buf):
+                    raise ValueError
+                record, end = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    if pos >= len(buf):
+                        return
+                    raise ValueError(f"Truncated CloudTrail file: {path}")
+                # Drop consumed text, then grow reads geometrically so a
+                # single huge record is not re-decoded once per chunk
+                buf = buf[pos:]
+                pos = 0
+                fill(read_size)
+                read_size *= 2
+                continue
+
+            read_size = chunk_size
+            pos = end
+            yield record
+
+
+def iter_records(paths, chunk_size=CHUNK_SIZE):
+    for path in iter_trail_files(paths):
+        yield from iter_file_records(path, chunk_size)
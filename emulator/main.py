@@ -1,10 +1,13 @@
 import pyautogui
+import argparse
+import heapq
 import time
 import random
 from datetime import datetime, timedelta
 import os
 import subprocess
 import threading
+from collections import deque
 from pynput import mouse, keyboard
 from rich.console import Console
 from rich.panel import Panel
@@ -13,21 +16,121 @@ from rich.live import Live
 from rich.progress import Progress, ProgressBar
 from rich import box
 from rich.text import Text
+from rich.markup import escape
 
 # Initialize Rich console
 console = Console()
 layout = Layout()
 
+class Clock:
+    """
+    Wall time, monotonic time and sleeping for the whole monitor. Replacing
+    the module-level clock lets the schedule run on simulated time.
+    """
+
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        """
+        Block until the event is set or the timeout passes.
+
+        Returns:
+            bool: Whether the event was set
+        """
+        return event.wait(timeout)
+
+clock = Clock()
+
 # Add this at the top level of your file
-last_activity_time = datetime.now()
+# Monotonic time of the last input; listeners only move it forward once
+# per ACTIVITY_RESOLUTION so bursts of mouse events cost almost nothing
+last_activity = clock.monotonic()
+ACTIVITY_RESOLUTION = 0.25  # seconds
 INACTIVITY_THRESHOLD = 30
+# Set EMULATOR_MEASURE_ACTIVITY=1 to time the input listener callbacks
+MEASURE_ACTIVITY = os.environ.get("EMULATOR_MEASURE_ACTIVITY") == "1"
+activity_stats = {"callbacks": 0, "seconds": 0.0, "started": time.monotonic()}
+# The keyboard and mouse listeners run in separate threads
+activity_stats_lock = threading.Lock()
 ACTIVE = False
 current_progress = None
 current_progress_description = ""
 current_progress_value = 0
 current_progress_total = 0
 duo_sso_last_run = None
+last_reset_date = None
 DUO_SSO_INTERVAL = 45 * 60  # 45 minutes in seconds
+DISPLAY_REFRESH = 1  # seconds between status panel updates while idle
+DUO_SSO_TIMEOUT = 30  # seconds before a hanging duo-sso is killed
+DUO_SSO_OUTPUT_LINES = 6  # lines of duo-sso output shown in the status panel
+DUO_SSO_RETRY_BACKOFF = [60, 120, 300, 600]  # seconds before retrying a failed run
+WORKING_HOURS_START = 7
+WORKING_HOURS_END = 17
+
+class Scheduler:
+    """
+    Named deadlines kept in a heap, and an event that wakes the main loop.
+
+    wait() sleeps until the earliest deadline or until wake() is called,
+    instead of polling. Rescheduling a name replaces its deadline; the old
+    heap entry is skipped when it surfaces.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+        self.wakeup = threading.Event()
+        self.counter = 0
+
+    def schedule(self, name, at):
+        # The loop sets most deadlines again on every pass
+        if self.deadlines.get(name) == at:
+            return
+        self.deadlines[name] = at
+        self.counter += 1
+        heapq.heappush(self.heap, (at, self.counter, name))
+
+    def next_deadline(self):
+        while self.heap:
+            at, _, name = self.heap[0]
+            if self.deadlines.get(name) == at:
+                return at, name
+            heapq.heappop(self.heap)
+        return None, None
+
+    def wake(self):
+        self.wakeup.set()
+
+    def wait(self):
+        """
+        Sleep until the next deadline or a wake() call.
+
+        Returns:
+            list: Names of the deadlines that are due
+        """
+        at, _ = self.next_deadline()
+        if at is not None:
+            clock.wait(self.wakeup, max((at - clock.now()).total_seconds(), 0))
+        self.wakeup.clear()
+
+        now = clock.now()
+        due = []
+        while True:
+            at, name = self.next_deadline()
+            if at is None or at > now:
+                return due
+            heapq.heappop(self.heap)
+            del self.deadlines[name]
+            due.append(name)
+
+scheduler = Scheduler()
 
 def seconds_to_hhmmss(seconds):
     """
@@ -49,13 +152,12 @@ def seconds_to_hhmmss(seconds):
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 def create_status_panel():
-    current_time = datetime.now()
+    current_time = clock.now()
     working_hours_data = is_working_hours()
     is_working = working_hours_data["is_working_hours"]
     
     # Convert seconds to HH:MM:SS format
-    last_activity_seconds = (current_time - last_activity_time).total_seconds()
-    last_activity_formatted = seconds_to_hhmmss(last_activity_seconds)
+    last_activity_formatted = seconds_to_hhmmss(seconds_since_activity())
     
     # Calculate duo-sso countdown
     duo_sso_status = "Never run"
@@ -77,7 +179,12 @@ Working Hours: [{'green' if is_working else 'red'}]{'Yes' if is_working else 'No
 Working Hour Range: [cyan]{working_hours_data["start"]} - {working_hours_data["end"]}[/cyan]
 Last Activity: [yellow]{last_activity_formatted} ago[/yellow]
 Duo-SSO Status: [{'green' if duo_sso_last_run and (current_time - duo_sso_last_run).total_seconds() < DUO_SSO_INTERVAL else 'yellow'}]{duo_sso_status}[/]
-Duo-SSO Countdown: [blue]{duo_sso_countdown}[/blue]"""
+Duo-SSO Countdown: [blue]{duo_sso_countdown}[/blue]
+Duo-SSO Run: {duo_sso.describe()}"""
+    for line in list(duo_sso.output):
+        status_content += f"\n  [dim]{escape(line)}[/dim]"
+    if MEASURE_ACTIVITY:
+        status_content += f"\nInput Listeners: [magenta]{activity_report()}[/magenta]"
 
     # Add progress information if there's an active countdown
     if current_progress_total > 0:
@@ -102,12 +209,12 @@ def press_caps_lock():
     pyautogui.press('capslock')
 
 def is_working_hours():
-    current_hour = datetime.now().hour
+    current_hour = clock.now().hour
     working_hours = {
         "start": "7 AM",
         "end": "5 PM",
-        "start_hour": 7,
-        "end_hour": 17,
+        "start_hour": WORKING_HOURS_START,
+        "end_hour": WORKING_HOURS_END,
         "is_working_hours": False
     }
     if working_hours["start_hour"] <= current_hour < working_hours["end_hour"]:
@@ -115,95 +222,215 @@ def is_working_hours():
         
     return working_hours
 
-def run_duo_sso_command():
+class DuoSsoRunner:
     """
-    Run the duo-sso command and capture its output.
-    This function runs in a separate thread to avoid blocking the main program.
+    Runs duo-sso in the background, at most one invocation at a time.
+
+    stdout and stderr are read line by line as they arrive into a ring
+    buffer that the status panel shows, so nothing is printed over the Live
+    display. A failed run is retried after the next DUO_SSO_RETRY_BACKOFF
+    delay instead of a whole DUO_SSO_INTERVAL.
     """
-    try:
-        # Run duo-sso command and capture output
-        result = subprocess.run(
-            ['duo-sso'], 
-            capture_output=True, 
-            text=True, 
-            timeout=30  # 30 second timeout
-        )
-        
-        # Display the output
-        if result.stdout:
-            console.print("[green]duo-sso output:[/green]")
-            console.print(result.stdout)
-        
-        if result.stderr:
-            console.print("[yellow]duo-sso stderr:[/yellow]")
-            console.print(result.stderr)
-        
-        if result.returncode == 0:
-            console.print("[green]duo-sso command completed successfully[/green]")
+
+    def __init__(self, command=("duo-sso",), timeout=DUO_SSO_TIMEOUT):
+        self.command = list(command)
+        self.timeout = timeout
+        self.background = True
+        self.lock = threading.Lock()
+        self.output = deque(maxlen=DUO_SSO_OUTPUT_LINES)
+        self.running = False
+        self.started = None
+        self.duration = None
+        self.status = None
+        self.failures = 0
+        self.retry_at = None
+
+    def start(self):
+        """
+        Start a run unless one is still in flight.
+
+        Returns:
+            bool: Whether a run was started
+        """
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.started = clock.monotonic()
+            self.retry_at = None
+        if self.background:
+            threading.Thread(target=self._run, daemon=True).start()
         else:
-            console.print(f"[red]duo-sso command failed with return code: {result.returncode}[/red]")
-            
-    except subprocess.TimeoutExpired:
-        console.print("[red]duo-sso command timed out after 30 seconds[/red]")
-    except subprocess.CalledProcessError as e:
-        console.print(f"[red]Error running duo-sso command: {e}[/red]")
-        if e.stdout:
-            console.print(f"stdout: {e.stdout}")
-        if e.stderr:
-            console.print(f"stderr: {e.stderr}")
-    except FileNotFoundError:
-        console.print("[red]duo-sso command not found. Please ensure it's installed and in your PATH[/red]")
-    except Exception as e:
-        console.print(f"[red]Unexpected error running duo-sso command: {e}[/red]")
+            self._run()
+        return True
+
+    def _read(self, stream, prefix):
+        for line in stream:
+            self.output.append(prefix + line.rstrip())
+        stream.close()
+
+    def _run(self):
+        succeeded, status = False, "interrupted"
+        try:
+            succeeded, status = self._execute()
+        except Exception as e:
+            status = f"Error running duo-sso command: {e}"
+        finally:
+            # Never leave the runner marked as in flight
+            with self.lock:
+                self.running = False
+                self.duration = clock.monotonic() - self.started
+                self.status = status
+                if succeeded:
+                    self.failures = 0
+                else:
+                    delay = DUO_SSO_RETRY_BACKOFF[min(self.failures, len(DUO_SSO_RETRY_BACKOFF) - 1)]
+                    self.failures += 1
+                    self.retry_at = clock.now() + timedelta(seconds=delay)
+            scheduler.wake()
+
+    def _execute(self):
+        """
+        Returns:
+            tuple: (whether duo-sso succeeded, status text)
+        """
+        succeeded = False
+        try:
+            process = subprocess.Popen(self.command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, text=True, errors="replace",
+                                       bufsize=1)
+        except FileNotFoundError:
+            status = "duo-sso command not found in PATH"
+        except OSError as e:
+            status = f"Error running duo-sso command: {e}"
+        else:
+            readers = [threading.Thread(target=self._read, args=(process.stdout, ""), daemon=True),
+                       threading.Thread(target=self._read, args=(process.stderr, "stderr: "),
+                                        daemon=True)]
+            for reader in readers:
+                reader.start()
+            try:
+                returncode = process.wait(timeout=self.timeout)
+                succeeded = returncode == 0
+                status = "completed" if succeeded else f"failed with return code {returncode}"
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                status = f"timed out after {self.timeout} seconds"
+            for reader in readers:
+                reader.join(timeout=1)
+        return succeeded, status
+
+    def describe(self):
+        """
+        Returns:
+            str: Rich markup for the current or last run
+        """
+        with self.lock:
+            if self.running:
+                return f"[yellow]running for {seconds_to_hhmmss(clock.monotonic() - self.started)}[/yellow]"
+            if self.status is None:
+                return "[white]not run yet[/white]"
+            color = "red" if self.retry_at else "green"
+            text = f"[{color}]{escape(self.status)} ({self.duration:.1f}s)[/{color}]"
+            if self.retry_at:
+                text += f", retry {self.failures} at {self.retry_at.strftime('%H:%M:%S')}"
+            return text
+
+duo_sso = DuoSsoRunner()
 
 def run_duo_sso_if_needed():
     """
     Check if duo-sso should be run during working hours.
-    Runs every 50 minutes during working hours.
+    Runs every DUO_SSO_INTERVAL during working hours, sooner to retry a
+    failed run, and never while the previous run is still going.
     """
     global duo_sso_last_run
     
-    current_time = datetime.now()
+    current_time = clock.now()
     
     # Check if it's working hours and enough time has passed since last run
-    if (is_working_hours()["is_working_hours"] and 
-        (duo_sso_last_run is None or (current_time - duo_sso_last_run).total_seconds() >= DUO_SSO_INTERVAL)):
-        
-        # Run duo-sso in a separate thread
-        duo_thread = threading.Thread(target=run_duo_sso_command, daemon=True)
-        duo_thread.start()
-        
+    due = (duo_sso_last_run is None
+           or (current_time - duo_sso_last_run).total_seconds() >= DUO_SSO_INTERVAL
+           or (duo_sso.retry_at is not None and current_time >= duo_sso.retry_at))
+    if is_working_hours()["is_working_hours"] and due and duo_sso.start():
         duo_sso_last_run = current_time
-        console.print("[yellow]duo-sso command scheduled to run[/yellow]")
 
 def reset_daily_flags():
     """
     Reset daily flags at the start of each new day.
     This ensures duo-sso can run again the next day.
     """
-    global duo_sso_last_run
+    global duo_sso_last_run, last_reset_date
     
-    current_time = datetime.now()
+    today = clock.now().date()
     
-    # Reset flags at midnight (00:00)
-    if current_time.hour == 0 and current_time.minute == 0:
+    # Reset flags on the first pass of a new day; the loop is usually
+    # asleep in a countdown at midnight itself
+    if last_reset_date is None:
+        last_reset_date = today
+    elif today != last_reset_date:
+        last_reset_date = today
         duo_sso_last_run = None # Reset last run
         console.print("[cyan]Daily flags reset - duo-sso can run again today[/cyan]")
 
+def seconds_since_activity():
+    return clock.monotonic() - last_activity
+
 def check_no_activity():
-    global last_activity_time
-    current_time = datetime.now()
-    time_difference = (current_time - last_activity_time).total_seconds()
-    if time_difference >= INACTIVITY_THRESHOLD:
-        last_activity_time = current_time - timedelta(seconds=INACTIVITY_THRESHOLD)
+    global last_activity
+    if seconds_since_activity() >= INACTIVITY_THRESHOLD:
+        last_activity = clock.monotonic() - INACTIVITY_THRESHOLD
         return True
     return False
 
 def on_activity():
-    global last_activity_time
-    last_activity_time = datetime.now()
+    global last_activity
+    now = clock.monotonic()
+    idle = now - last_activity
+    if idle >= ACTIVITY_RESOLUTION:
+        last_activity = now
+        # Coming back from idle: refresh the panel now rather than at the
+        # next deadline. Continuous input does not wake the main loop.
+        if idle >= DISPLAY_REFRESH:
+            scheduler.wake()
     return True
 
+def measured(callback):
+    """
+    Wrap a listener callback to count its calls and the time spent in it.
+
+    Args:
+        callback (callable): pynput listener callback
+
+    Returns:
+        callable: Callback that records into activity_stats
+    """
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return callback(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with activity_stats_lock:
+                activity_stats["callbacks"] += 1
+                activity_stats["seconds"] += elapsed
+    return wrapper
+
+def activity_report():
+    """
+    Summarize the listener callbacks measured so far.
+
+    Returns:
+        str: Callback rate and mean cost per callback
+    """
+    with activity_stats_lock:
+        calls = activity_stats["callbacks"]
+        seconds = activity_stats["seconds"]
+    elapsed = max(time.monotonic() - activity_stats["started"], 1e-9)
+    cost = seconds / calls * 1e6 if calls else 0
+    return f"{calls / elapsed:.1f} callbacks/s, {cost:.1f} µs each ({calls} total)"
+
 def on_mouse_move(x, y):
     return on_activity()
 
@@ -223,37 +450,312 @@ def on_key_press(key):
         return on_activity()
 
 def setup_activity_listeners():
-    keyboard_listener = keyboard.Listener(on_press=on_key_press)
+    wrap = measured if MEASURE_ACTIVITY else (lambda callback: callback)
+    keyboard_listener = keyboard.Listener(on_press=wrap(on_key_press))
     keyboard_listener.start()
     
     mouse_listener = mouse.Listener(
-        on_move=on_mouse_move,
-        on_click=on_mouse_click
+        on_move=wrap(on_mouse_move),
+        on_click=wrap(on_mouse_click)
     )
     mouse_listener.start()
     
     return keyboard_listener, mouse_listener
 
+def schedule_next_wakeups(scheduler):
+    """
+    Set every deadline at which the main loop has something to do: the
+    inactivity threshold, the next duo-sso run, the working-hours boundary
+    and the next display refresh.
+    """
+    current_time = clock.now()
+    scheduler.schedule("inactivity",
+                       current_time + timedelta(seconds=INACTIVITY_THRESHOLD - seconds_since_activity()))
+    # Without a last run, duo-sso starts at the working-hours boundary
+    if duo_sso_last_run is not None:
+        scheduler.schedule("duo-sso", duo_sso_last_run + timedelta(seconds=DUO_SSO_INTERVAL))
+    if duo_sso.retry_at is not None:
+        scheduler.schedule("duo-sso-retry", duo_sso.retry_at)
+
+    today = current_time.replace(minute=0, second=0, microsecond=0)
+    boundary = today.replace(hour=WORKING_HOURS_START)
+    if boundary <= current_time:
+        boundary = today.replace(hour=WORKING_HOURS_END)
+    if boundary <= current_time:
+        boundary = today.replace(hour=WORKING_HOURS_START) + timedelta(days=1)
+    scheduler.schedule("working-hours", boundary)
+
+    scheduler.schedule("refresh", current_time + timedelta(seconds=DISPLAY_REFRESH))
+
 def countdown_with_live_display(target_end_time, description, live):
     global current_progress_description, current_progress_total, current_progress_value
     
     current_progress_description = description
-    current_progress_total = (target_end_time - datetime.now()).total_seconds()
+    current_progress_total = (target_end_time - clock.now()).total_seconds()
     current_progress_value = 0
     
-    while datetime.now() < target_end_time:
-        current_time = datetime.now()
+    while clock.now() < target_end_time:
+        current_time = clock.now()
         elapsed = (current_time - (target_end_time - timedelta(seconds=current_progress_total))).total_seconds()
         current_progress_value = max(0, current_progress_total - (target_end_time - current_time).total_seconds())
         
         live.update(create_status_panel())
-        time.sleep(1)
+        clock.sleep(1)
 
     current_progress_total = 0
     current_progress_value = 0
     current_progress_description = ""
 
+def next_working_day_start(current_time):
+    """
+    Args:
+        current_time (datetime): A time outside working hours
+
+    Returns:
+        datetime: When working hours start next
+    """
+    start = current_time.replace(hour=WORKING_HOURS_START, minute=0, second=0, microsecond=0)
+    # Before the start hour the next working day is still today
+    if start <= current_time:
+        start += timedelta(days=1)
+    return start
+
+def run_monitor(live, press=press_caps_lock):
+    """
+    The monitor's main loop.
+
+    Args:
+        live: Rich Live display, or anything with an update() method
+        press (callable): Simulates activity after the inactivity countdown
+    """
+    while True:
+        # Reset daily flags if needed
+        reset_daily_flags()
+        
+        # Check if duo-sso should be run
+        run_duo_sso_if_needed()
+        
+        if not is_working_hours()["is_working_hours"]:
+            # When outside working hours, immediately sleep until next working day
+            target_end_time = next_working_day_start(clock.now())
+            
+            countdown_with_live_display(target_end_time, "Sleeping until next working day", live)
+        else:
+            # During working hours, wait for inactivity then do random activity
+            if check_no_activity():
+                # Calculate random sleep duration and target end time
+                sleep_duration = random.randint(1, 300)
+                target_end_time = clock.now() + timedelta(seconds=sleep_duration)
+                
+                countdown_with_live_display(target_end_time, "Next activity in", live)
+                press()
+        
+        live.update(create_status_panel())
+
+        # Sleep until something is due instead of spinning
+        schedule_next_wakeups(scheduler)
+        scheduler.wait()
+
+class SimulationFinished(Exception):
+    pass
+
+class SimulatedClock(Clock):
+    """
+    Virtual time that jumps straight to the end of every sleep or wait, and
+    raises SimulationFinished instead of passing the end of the simulation.
+
+    Scripted input events (monotonic seconds) are fed to on_activity() as
+    the clock passes them, and a wait returns early once its event is set,
+    just as the listener threads would wake the real loop. Every sleep or
+    wait counts as one wakeup; the CPU time the monitor spent since the
+    previous one is charged to the simulated hour it ran in.
+    """
+
+    def __init__(self, start, end, activity=()):
+        self.start = start
+        self.end = (end - start).total_seconds()
+        self.elapsed = 0.0
+        self.activity = sorted(activity)
+        self.next_input = 0
+        self.stats = {}  # simulated hour -> [wakeups, renders, CPU seconds]
+        # Hours the monitor sleeps through still count, with zeros
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        while hour < end:
+            self.stats[hour] = [0, 0, 0.0]
+            hour += timedelta(hours=1)
+        self.cpu_mark = time.process_time()
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def monotonic(self):
+        return self.elapsed
+
+    def hour_stats(self):
+        hour = self.now().replace(minute=0, second=0, microsecond=0)
+        return self.stats.setdefault(hour, [0, 0, 0.0])
+
+    def _advance(self, seconds, event=None):
+        # The monitor's own work up to here; feeding input is not counted
+        stats = self.hour_stats()
+        stats[0] += 1
+        stats[2] += time.process_time() - self.cpu_mark
+
+        # Like real time, some passes between any two reads of the clock
+        target = self.elapsed + max(seconds, 1e-6)
+        woken = event is not None and event.is_set()
+        while not woken and self.next_input < len(self.activity) \
+                and self.activity[self.next_input] <= target:
+            self.elapsed = max(self.elapsed, self.activity[self.next_input])
+            self.next_input += 1
+            on_activity()
+            woken = event is not None and event.is_set()
+        if not woken:
+            if target >= self.end:
+                raise SimulationFinished
+            self.elapsed = target
+        self.cpu_mark = time.process_time()
+        return woken
+
+    def sleep(self, seconds):
+        self._advance(seconds)
+
+    def wait(self, event, timeout):
+        return self._advance(timeout, event)
+
+class HeadlessLive:
+    """Stands in for rich's Live in simulations, counting renders instead."""
+
+    def update(self, renderable):
+        clock.hour_stats()[1] += 1
+
+class SimulatedDuoSso(DuoSsoRunner):
+    """Completes every run at once, in the calling thread, without duo-sso."""
+
+    def __init__(self):
+        super().__init__()
+        self.background = False
+        self.runs = 0
+
+    def _execute(self):
+        self.runs += 1
+        return True, "completed (simulated)"
+
+def simulated_activity(start, days, rng):
+    """
+    Script a user who works in bursts during working hours.
+
+    Args:
+        start (datetime): Start of the simulation
+        days (float): Length of the simulation
+        rng (random.Random): Source of the bursts and pauses
+
+    Returns:
+        list: Monotonic seconds of every input event
+    """
+    events = []
+    end = days * 86400
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while (day - start).total_seconds() < end:
+        at = (day.replace(hour=WORKING_HOURS_START) - start).total_seconds()
+        closing = (day.replace(hour=WORKING_HOURS_END) - start).total_seconds()
+        while at < closing:
+            # A burst of typing and mouse movement, then a pause
+            burst_end = at + rng.uniform(60, 3600)
+            while at < min(burst_end, closing):
+                if 0 <= at < end:
+                    events.append(at)
+                at += rng.expovariate(2)
+            at += rng.uniform(60, 1800)
+        day += timedelta(days=1)
+    return events
+
+def simulate(days, start=None, seed=0):
+    """
+    Run the monitor headless over days of simulated time.
+
+    Args:
+        days (float): Simulated days to run
+        start (datetime): Simulated start time (default: last midnight)
+        seed (int): Seed of the scripted activity and the countdowns
+
+    Returns:
+        dict: Per-hour stats, totals and the real time the run took
+    """
+    global clock, duo_sso, last_activity, last_reset_date, duo_sso_last_run, scheduler
+
+    # Put the real clock, runner and schedule back afterwards
+    saved = (clock, duo_sso, last_activity, last_reset_date, duo_sso_last_run, scheduler,
+             random.getstate())
+    start = start or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    rng = random.Random(seed)
+    random.seed(seed)
+    clock = SimulatedClock(start, start + timedelta(days=days),
+                           simulated_activity(start, days, rng))
+    duo_sso = SimulatedDuoSso()
+    scheduler = Scheduler()
+    last_activity = clock.monotonic()
+    last_reset_date = duo_sso_last_run = None
+    presses = []
+    simulated_clock, simulated_duo_sso = clock, duo_sso
+    console.quiet = True
+
+    began = time.perf_counter()
+    try:
+        run_monitor(HeadlessLive(), press=lambda: presses.append(on_key_press(None)))
+    except SimulationFinished:
+        pass
+    finally:
+        real_seconds = time.perf_counter() - began
+        console.quiet = False
+        (clock, duo_sso, last_activity, last_reset_date, duo_sso_last_run, scheduler,
+         random_state) = saved
+        random.setstate(random_state)
+
+    return {
+        "days": days,
+        "hours": simulated_clock.stats,
+        "inputs": simulated_clock.next_input,
+        "presses": len(presses),
+        "duo_sso_runs": simulated_duo_sso.runs,
+        "real_seconds": real_seconds,
+    }
+
+def simulation_report(result):
+    """
+    Print the stats of simulate(), averaged per hour of the day over the
+    simulated hours.
+
+    Args:
+        result (dict): Result of simulate()
+    """
+    console.print(f"[bold white]Simulated {result['days']:g} days in {result['real_seconds']:.2f}s[/bold white]")
+    console.print(f"{'Hour':>5} {'Wakeups/h':>10} {'Renders/h':>10} {'CPU ms/h':>10}")
+    hours = result["hours"]
+    for hour_of_day in range(24):
+        stats = [stats for hour, stats in hours.items() if hour.hour == hour_of_day]
+        if stats:
+            wakeups, renders, cpu = (sum(column) / len(stats) for column in zip(*stats))
+            console.print(f"{hour_of_day:>5} {wakeups:>10.0f} {renders:>10.0f} {cpu * 1000:>10.1f}")
+    wakeups, renders, cpu = (sum(column) / len(hours) for column in zip(*hours.values()))
+    console.print(f"{'Mean':>5} {wakeups:>10.0f} {renders:>10.0f} {cpu * 1000:>10.1f}")
+    console.print(f"Input events: {result['inputs']}, caps lock presses: {result['presses']}, "
+                  f"duo-sso runs: {result['duo_sso_runs']}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the session active during working hours")
+    parser.add_argument("--simulate", type=float, metavar="DAYS",
+                        help="run DAYS of schedule headless on a simulated clock and report "
+                             "wakeups, renders and CPU time per hour")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="simulated start time, YYYY-MM-DD[THH:MM] (default: last midnight)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the simulated activity")
+    args = parser.parse_args()
+
+    if args.simulate:
+        simulation_report(simulate(args.simulate, args.start, args.seed))
+        raise SystemExit
+
     console.clear()
     console.print("[bold blue]Activity Monitor Started[/bold blue]")
     
@@ -262,38 +764,9 @@ if __name__ == "__main__":
 
     try:
         with Live(create_status_panel(), refresh_per_second=1) as live:
-            while True:
-                # Reset daily flags if needed
-                reset_daily_flags()
-                
-                # Check if duo-sso should be run
-                run_duo_sso_if_needed()
-                
-                if not is_working_hours()["is_working_hours"]:
-                    # When outside working hours, immediately sleep until next working day
-                    # Calculate the target end time for next working day
-                    current_time = datetime.now()
-                    working_hours = is_working_hours()
-                    start_hour = working_hours["start_hour"]
-                    
-                    # Calculate tomorrow's date
-                    next_day = current_time + timedelta(days=1)
-                    target_end_time = next_day.replace(hour=start_hour, minute=0, second=0, microsecond=0)
-                    
-                    countdown_with_live_display(target_end_time, "Sleeping until next working day", live)
-                else:
-                    # During working hours, wait for inactivity then do random activity
-                    if check_no_activity():
-                        # Calculate random sleep duration and target end time
-                        sleep_duration = random.randint(1, 300)
-                        target_end_time = datetime.now() + timedelta(seconds=sleep_duration)
-                        
-                        countdown_with_live_display(target_end_time, "Next activity in", live)
-                        press_caps_lock()
-                
-                live.update(create_status_panel())
+            run_monitor(live)
                 
     except KeyboardInterrupt:
         console.print("[red]Program terminated by user[/red]")
         keyboard_listener.stop()
-        mouse_listener.stop()
\ No newline at end of file
+        mouse_listener.stop()